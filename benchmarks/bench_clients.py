@@ -0,0 +1,69 @@
+"""
+Microbenchmark: per-call latency of a fresh API client per call vs the shared client registry.
+
+Usage:
+    python benchmarks/bench_clients.py data/CNH_Aberta/00000000_in.jpg --calls 20
+    python benchmarks/bench_clients.py --construct-only
+
+With an image, every call runs a real Google Vision text detection, so valid
+credentials are required. With --construct-only only the client setup is timed.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from doc_vision.clients import get_vision_client, reset_clients
+
+
+def percentile(values, fraction):
+    """Returns the given percentile (0-1) of a list of values."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run(label, get_client, calls, content):
+    from google.cloud import vision
+
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        client = get_client()
+        if content is not None:
+            client.text_detection(image=vision.Image(content=content))
+        latencies.append(time.perf_counter() - start)
+
+    print(
+        f"{label:<10} mean={statistics.mean(latencies) * 1000:8.1f} ms  "
+        f"p50={percentile(latencies, 0.5) * 1000:8.1f} ms  "
+        f"p95={percentile(latencies, 0.95) * 1000:8.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("image", nargs="?", help="Image sent to Google Vision on every call.")
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--construct-only", action="store_true", help="Only time client creation.")
+    args = parser.parse_args()
+
+    if not args.construct_only and not args.image:
+        parser.error("an image is required unless --construct-only is given")
+
+    content = None
+    if not args.construct_only:
+        with open(args.image, "rb") as image_file:
+            content = image_file.read()
+
+    from google.cloud import vision
+
+    reset_clients()
+    run("per-call", vision.ImageAnnotatorClient, args.calls, content)
+    run("shared", get_vision_client, args.calls, content)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Cold-start guard: measures the import time of the doc_vision package with `python -X importtime`.
+
+Usage:
+    python benchmarks/bench_import_time.py --max-ms 150
+
+Exits with status 1 when the import takes longer than --max-ms or when a heavy
+SDK (Google Cloud, OpenAI) is imported eagerly.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# SDKs that must only be imported on first use
+HEAVY_MODULES = ("google.cloud.vision", "google.cloud.language_v1", "openai", "grpc", "httpx")
+
+
+def import_times(module, repeat):
+    """
+    Imports a module in fresh interpreters and returns the best cumulative time per imported module.
+
+    Args:
+        module (str): Module to import.
+        repeat (int): Number of fresh interpreters to run.
+
+    Returns:
+        dict: Imported module name -> cumulative import time in microseconds.
+    """
+    best = {}
+    for _ in range(repeat):
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        )
+        for line in process.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            name = name.strip()
+            best[name] = min(best.get(name, float("inf")), int(cumulative))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="doc_vision.process_document")
+    parser.add_argument("--max-ms", type=float, default=150.0, help="Import time budget in milliseconds.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to show.")
+    args = parser.parse_args()
+
+    times = import_times(args.module, args.repeat)
+    total_ms = times[args.module] / 1000
+
+    print(f"{args.module}: {total_ms:.1f} ms (budget {args.max_ms:.1f} ms)")
+    for name, micros in sorted(times.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {micros / 1000:8.1f} ms  {name}")
+
+    eager = [name for name in times if name.startswith(HEAVY_MODULES)]
+    if eager:
+        print(f"❌ Heavy SDKs imported eagerly: {', '.join(sorted(eager))}")
+    if total_ms > args.max_ms:
+        print("❌ Import time over budget")
+    if eager or total_ms > args.max_ms:
+        sys.exit(1)
+    print("✅ Cold start within budget")
+
+
+if __name__ == "__main__":
+    main()
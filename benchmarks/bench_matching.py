@@ -0,0 +1,136 @@
+"""
+Benchmark: fuzzy field matching of metric_calculation on a synthetic evaluation set.
+
+Usage:
+    python benchmarks/bench_matching.py --documents 10000
+    python benchmarks/bench_matching.py --documents 2000 --workers 8
+
+Builds documents with extracted fields and ground-truth lines (exact copies,
+OCR-like typos and unrelated lines), then times the previous all-pairs
+comparison against the indexed GroundTruthIndex, serially and on a process
+pool. Exits with status 1 if any `matched` flag differs between the two.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metric_calculation import check_field_accuracy, clean_text, similar
+
+WORDS = (
+    "maria jose silva santos oliveira souza lima pereira ferreira costa rodrigues almeida nascimento "
+    "carvalho gomes martins araujo ribeiro rocha sao paulo rio de janeiro belo horizonte salvador "
+    "brasilia curitiba recife fortaleza ssp detran secretaria seguranca publica registro geral"
+).split()
+
+
+def naive_field_accuracy(organized_info, ground_truth_text):
+    """The all-pairs matching used before the index, kept as the reference."""
+    results = {}
+    total_fields = 0
+    matched_fields = 0
+    for key, value in organized_info.items():
+        items = value if isinstance(value, list) else [value]
+        flags = []
+        for item in items:
+            total_fields += 1
+            normalized_item = clean_text(item, preserve_accents=True)
+            matched = any(
+                similar(normalized_item, clean_text(gt, preserve_accents=True)) >= 0.75 for gt in ground_truth_text
+            )
+            flags.append({"value": item, "matched": matched})
+            matched_fields += matched
+        results[key] = flags if isinstance(value, list) else flags[0]
+    return results, matched_fields / total_fields if total_fields else 0
+
+
+def typo(text, rng, rate):
+    """Replaces, drops or duplicates characters like a noisy OCR."""
+    chars = []
+    for char in text:
+        draw = rng.random()
+        if draw < rate / 3:
+            chars.append(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789"))
+        elif draw < 2 * rate / 3:
+            continue
+        elif draw < rate:
+            chars.extend([char, char])
+        else:
+            chars.append(char)
+    return "".join(chars)
+
+
+def make_document(rng):
+    """Returns (extracted fields, ground-truth set) for one synthetic document."""
+    truth = {
+        "Nome": " ".join(rng.choice(WORDS).upper() for _ in range(rng.randint(2, 5))),
+        "RG": f"{rng.randint(10, 99)}.{rng.randint(100, 999)}.{rng.randint(100, 999)}-{rng.randint(0, 9)}",
+        "CPF": f"{rng.randint(100, 999)}.{rng.randint(100, 999)}.{rng.randint(100, 999)}-{rng.randint(10, 99)}",
+        "Data de Nascimento": f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(1940, 2010)}",
+        "Naturalidade": f"{rng.choice(WORDS).upper()} {rng.choice(WORDS).upper()}",
+        "Filiação": [" ".join(rng.choice(WORDS).upper() for _ in range(rng.randint(2, 4))) for _ in range(2)],
+    }
+    lines = [value for value in truth.values() if isinstance(value, str)] + truth["Filiação"]
+    lines += [" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 8))) for _ in range(rng.randint(20, 60))]
+    ground_truth = {clean_text(line, preserve_accents=True) for line in lines}
+
+    # Extractions range from exact to badly garbled
+    rate = rng.choice((0.0, 0.05, 0.15, 0.4))
+    extracted = {
+        field: [typo(item, rng, rate) for item in value] if isinstance(value, list) else typo(value, rng, rate)
+        for field, value in truth.items()
+    }
+    return extracted, ground_truth
+
+
+def score_all(func, documents):
+    return [func(extracted, ground_truth) for extracted, ground_truth in documents]
+
+
+def score_chunk(documents):
+    return score_all(check_field_accuracy, documents)
+
+
+def timed(label, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<18} {elapsed:8.2f} s")
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    documents = [make_document(rng) for _ in range(args.documents)]
+    print(f"{args.documents} documents, {sum(len(gt) for _, gt in documents)} ground-truth lines")
+
+    reference, naive_time = timed("all pairs", score_all, naive_field_accuracy, documents)
+    indexed, indexed_time = timed("indexed", score_all, check_field_accuracy, documents)
+
+    chunks = [documents[i:i + 250] for i in range(0, len(documents), 250)]
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        pooled, pooled_time = timed(f"indexed, {args.workers} procs", lambda: [
+            result for chunk in executor.map(score_chunk, chunks) for result in chunk
+        ])
+
+    print(f"speedup: {naive_time / indexed_time:.1f}x serial, {naive_time / pooled_time:.1f}x pooled")
+
+    mismatches = sum(1 for expected, *others in zip(reference, indexed, pooled) if any(o != expected for o in others))
+    if mismatches:
+        print(f"❌ {mismatches} documents with different matched flags")
+        sys.exit(1)
+    print("✅ Matched flags identical to all-pairs matching")
+
+
+if __name__ == "__main__":
+    main()
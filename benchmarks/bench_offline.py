@@ -0,0 +1,353 @@
+"""
+Offline benchmark suite: measures the pipeline against local Vision and OpenAI stubs.
+
+Usage:
+    python benchmarks/bench_offline.py --documents 200 --output bench_results.json
+    python benchmarks/bench_offline.py --vision-latency 0.3 --gpt-latency 1.2 --error-rate 0.05
+    python benchmarks/bench_offline.py --compare bench_results.json
+
+Scenarios:
+    batch     main.py stages (OCR, extraction, write) over synthetic CNH and RG images
+    packed    the same batch with packed GPT extraction
+    vote      gpt_extract_with_vote and @vote(5) under disagreeing GPT answers
+    pdf       process_pdf over multi-page PDFs with a stub renderer
+    metrics   metric_calculation.check_field_accuracy over synthetic results
+    sink      result writes: one fsynced JSON per document vs the result store's group commits
+
+For each scenario the suite reports documents/sec, p50/p95/p99 per-document
+latency, peak traced memory and, for batch runs, the per-stage timings
+of doc_vision.tracing, and writes them as JSON together with the
+commit and the stub settings, so runs on two commits can be compared.
+No network access or credentials are needed; caches and image preprocessing
+are disabled and API quotas are lifted so only the pipeline is measured.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ["DOC_VISION_NO_CACHE"] = "1"
+os.environ["DOC_VISION_PREPROCESS"] = "0"
+for provider in ("VISION", "OPENAI", "LANGUAGE"):
+    os.environ[f"DOC_VISION_{provider}_RPM"] = "0"
+    os.environ[f"DOC_VISION_{provider}_TPM"] = "0"
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main as batch
+from doc_vision import metrics, pdf, process_document as pipeline, tracing
+from doc_vision.clients import set_client
+from doc_vision.decorators import vote
+from doc_vision.pipeline import Stage, run_pipeline
+from doc_vision.results_store import ResultStore
+from doc_vision.schemas import get_schema
+from metric_calculation import check_field_accuracy, clean_text
+from stubs import Behavior, StubOpenAI, StubVision, install_pdf2image, synthetic_fields, synthetic_image, synthetic_text
+
+DOCUMENT_TYPES = {"CNH_Aberta": "CNH", "RG_Aberto": "RG"}
+
+
+def percentile(values, fraction):
+    """Returns the given percentile (0-1) of a list of values."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def summarize(latencies, elapsed, peak_bytes, **extra):
+    """Builds the result record of a scenario."""
+    result = {
+        "documents": len(latencies),
+        "documents_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.5) * 1000 if latencies else None,
+        "p95_ms": percentile(latencies, 0.95) * 1000 if latencies else None,
+        "p99_ms": percentile(latencies, 0.99) * 1000 if latencies else None,
+        "peak_memory_mb": peak_bytes / 1024 ** 2,
+    }
+    result.update(extra)
+    return result
+
+
+def measured(func, *args):
+    """Runs func(*args) under tracemalloc; returns its result, the elapsed seconds and the peak memory."""
+    metrics.reset()
+    tracing.reset()
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = func(*args)
+    finally:
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def make_dataset(root, vision, documents):
+    """Writes synthetic `*_in.jpg` images and registers their OCR text with the Vision stub."""
+    input_dirs = []
+    for index in range(documents):
+        name, document_type = list(DOCUMENT_TYPES.items())[index % len(DOCUMENT_TYPES)]
+        input_dir = os.path.join(root, "data", name)
+        if input_dir not in input_dirs:
+            os.makedirs(input_dir, exist_ok=True)
+            input_dirs.append(input_dir)
+        content = synthetic_image(index)
+        with open(os.path.join(input_dir, f"{index:08d}_in.jpg"), "wb") as image_file:
+            image_file.write(content)
+        vision.add(content, synthetic_text(synthetic_fields(document_type, index)))
+    return input_dirs
+
+
+def run_batch(input_dirs, results_dir, args, packed=False):
+    """Runs the main.py stages and returns the per-document latencies."""
+    started = {}
+    latencies = []
+
+    def jobs():
+        for job in batch.iter_jobs([batch.parse_input(input_dir) for input_dir in input_dirs], results_dir):
+            started[job["file_name"]] = time.perf_counter()
+            yield job
+
+    def write_stage(job):
+        job = batch.write_stage(job)
+        latencies.append(time.perf_counter() - started[job["file_name"]])
+        return job
+
+    extraction = (
+        Stage("extraction", batch.packed_extraction_stage, workers=args.gpt_workers, batch_size=8)
+        if packed else
+        Stage("extraction", batch.extraction_stage, workers=args.gpt_workers)
+    )
+    stages = [Stage("ocr", batch.ocr_stage, workers=args.ocr_workers), extraction, Stage("write", write_stage)]
+    _, failures = run_pipeline(jobs(), stages)
+    return latencies, len(failures)
+
+
+def bench_batch(args, vision, gpt, packed=False):
+    workdir = tempfile.mkdtemp(prefix="bench_offline_")
+    try:
+        input_dirs = make_dataset(workdir, vision, args.documents)
+        gpt.requests = 0
+        (latencies, failures), elapsed, peak = measured(
+            run_batch, input_dirs, os.path.join(workdir, "results"), args, packed
+        )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return summarize(latencies, elapsed, peak, failures=failures, gpt_requests=gpt.requests,
+                     counters=metrics.snapshot(), stages=tracing.stage_stats())
+
+
+def bench_vote(args, vision, gpt):
+    documents = max(1, args.documents // 4)
+    texts = [(synthetic_text(synthetic_fields("CNH", index)), "CNH") for index in range(documents)]
+
+    @vote(5)
+    def sampled(text, document_type):
+        return pipeline.gpt_extract_information(text, document_type, use_cache=False)
+
+    def run():
+        results = {"single_request": [], "decorator": []}
+        for text, document_type in texts:
+            start = time.perf_counter()
+            pipeline.gpt_extract_with_vote(text, document_type, n=5)
+            results["single_request"].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            sampled(text, document_type)
+            results["decorator"].append(time.perf_counter() - start)
+        return results
+
+    gpt.disagreement = args.disagreement
+    try:
+        results, elapsed, peak = measured(run)
+    finally:
+        gpt.disagreement = 0.0
+    return {
+        label: summarize(latencies, sum(latencies), peak)
+        for label, latencies in results.items()
+    }
+
+
+def bench_pdf(args, vision, gpt):
+    pages = [synthetic_image(1_000_000 + page) for page in range(args.pdf_pages)]
+    for page, content in enumerate(pages):
+        vision.add(content, synthetic_text(synthetic_fields("Imposto de Renda", page)))
+    install_pdf2image(pages, Behavior(latency=args.render_latency))
+    documents = max(1, args.documents // 10)
+
+    def run():
+        latencies = []
+        for _ in range(documents):
+            # Clear the OCR memo so every PDF is read again, as a new upload would be
+            pipeline._ocr_memo.clear()
+            start = time.perf_counter()
+            pdf.process_pdf(b"%PDF-stub", "Imposto de Renda", pages=range(1, args.pdf_pages + 1))
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    latencies, elapsed, peak = measured(run)
+    return summarize(latencies, elapsed, peak, pages=args.pdf_pages)
+
+
+def bench_metrics(args, vision, gpt):
+    samples = []
+    for index in range(args.documents):
+        document_type = list(DOCUMENT_TYPES.values())[index % len(DOCUMENT_TYPES)]
+        values = synthetic_fields(document_type, index)
+        ground_truth = {clean_text(value, preserve_accents=True) for value in values.values() if isinstance(value, str)}
+        ground_truth |= {f"ruido {index} {n}" for n in range(40)}
+        samples.append((get_schema(document_type).scored_values(values), ground_truth))
+
+    def run():
+        latencies = []
+        for scored, ground_truth in samples:
+            start = time.perf_counter()
+            check_field_accuracy(scored, ground_truth)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    latencies, elapsed, peak = measured(run)
+    return summarize(latencies, elapsed, peak)
+
+
+def bench_sink(args, vision, gpt):
+    results = [
+        pipeline.build_result(synthetic_text(values), "RG", values)
+        for values in (synthetic_fields("RG", index) for index in range(args.documents))
+    ]
+
+    def run(workdir, store, json_files):
+        latencies = []
+        for index, result in enumerate(results):
+            job = {
+                "name": f"RG_Aberto/{index:08d}", "file_name": f"{index:08d}_in.jpg", "input_hash": None,
+                "output_file": os.path.join(workdir, "RG_Aberto", f"{index:08d}.json"), "result": result,
+            }
+            start = time.perf_counter()
+            batch.write_stage(job, store=store, json_files=json_files)
+            latencies.append(time.perf_counter() - start)
+        if store is not None:
+            store.close()
+        return latencies
+
+    sinks = {"json_fsync": (False, True), "store": (True, False), "store_and_json": (True, True)}
+    summaries = {}
+    for label, (use_store, json_files) in sinks.items():
+        workdir = tempfile.mkdtemp(prefix="bench_sink_")
+        try:
+            store = ResultStore(os.path.join(workdir, "results.sqlite3")) if use_store else None
+            latencies, elapsed, peak = measured(run, workdir, store, json_files)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        summaries[label] = summarize(latencies, elapsed, peak)
+    return summaries
+
+
+SCENARIOS = {
+    "batch": bench_batch,
+    "packed": lambda args, vision, gpt: bench_batch(args, vision, gpt, packed=True),
+    "vote": bench_vote,
+    "pdf": bench_pdf,
+    "metrics": bench_metrics,
+    "sink": bench_sink,
+}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results, prefix=""):
+    """Yields (scenario, metrics) pairs, descending into nested scenarios such as vote."""
+    for name, value in results.items():
+        if "documents_per_sec" in value:
+            yield prefix + name, value
+        else:
+            yield from flatten(value, prefix + name + ".")
+
+
+def compare(current, baseline):
+    """Prints the relative change of throughput and latency against a previous run."""
+    previous = dict(flatten(baseline["scenarios"]))
+    print(f"\nvs {baseline.get('commit')}:")
+    for name, result in flatten(current["scenarios"]):
+        if name not in previous:
+            continue
+        changes = []
+        for key in ("documents_per_sec", "p95_ms", "peak_memory_mb"):
+            before, after = previous[name].get(key), result.get(key)
+            if before:
+                changes.append(f"{key} {100 * (after - before) / before:+.1f}%")
+        print(f"  {name:<22} {', '.join(changes)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--documents", type=int, default=100)
+    parser.add_argument("--vision-latency", type=float, default=0.05, help="Seconds per stub Vision request.")
+    parser.add_argument("--gpt-latency", type=float, default=0.2, help="Seconds per stub GPT request.")
+    parser.add_argument("--render-latency", type=float, default=0.05, help="Seconds per rendered PDF page.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of a retryable 503 per request.")
+    parser.add_argument("--disagreement", type=float, default=0.4, help="Probability a GPT answer differs (vote).")
+    parser.add_argument("--pdf-pages", type=int, default=4)
+    parser.add_argument("--ocr-workers", type=int, default=4)
+    parser.add_argument("--gpt-workers", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--compare", help="Previous JSON results to compare against.")
+    args = parser.parse_args()
+
+    vision = StubVision(behavior=Behavior(args.vision_latency, error_rate=args.error_rate, seed=args.seed))
+    gpt = StubOpenAI(behavior=Behavior(args.gpt_latency, error_rate=args.error_rate, seed=args.seed + 1))
+    pipeline.google_vision_extract = vision.extract
+    pipeline.google_vision_batch_extract = vision.batch_extract
+    set_client("openai", gpt)
+
+    # The pipeline's debug prints would dominate the measurements
+    real_stdout = sys.stdout
+    results = {}
+    for name in args.scenarios:
+        print(f"▶ {name}...", file=real_stdout)
+        with open(os.devnull, "w") as devnull:
+            sys.stdout = devnull
+            try:
+                results[name] = SCENARIOS[name](args, vision, gpt)
+            finally:
+                sys.stdout = real_stdout
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "scenarios": results,
+    }
+
+    for name, result in flatten(results):
+        print(
+            f"{name:<24} {result['documents_per_sec']:8.1f} docs/s  p50={result['p50_ms']:8.1f} ms  "
+            f"p95={result['p95_ms']:8.1f} ms  p99={result['p99_ms']:8.1f} ms  peak={result['peak_memory_mb']:6.1f} MB"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
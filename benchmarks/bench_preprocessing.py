@@ -0,0 +1,98 @@
+"""
+Benchmark: OCR payload, latency and field accuracy with and without image preprocessing.
+
+Usage:
+    python benchmarks/bench_preprocessing.py --limit 20
+    python benchmarks/bench_preprocessing.py --deskew --crop
+
+Runs every `*_in.jpg` of data/CNH_Aberta and data/RG_Aberto through Google
+Vision twice, once as uploaded and once preprocessed, bypassing the OCR cache,
+then organizes both texts with GPT and scores them with
+metric_calculation.check_field_accuracy against the `*_gt_ocr.txt` files.
+Valid Vision and OpenAI credentials are required.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from doc_vision.google_vision import google_vision_extract
+from doc_vision.images import preprocess_for_ocr
+from doc_vision.process_document import organize_document
+from doc_vision.schemas import detect_document_type, get_schema
+from doc_vision.utils import list_visible_information
+from metric_calculation import check_field_accuracy, extract_ground_truth_text
+
+DATA_DIRS = ("data/CNH_Aberta", "data/RG_Aberto")
+
+
+def percentile(values, fraction):
+    """Returns the given percentile (0-1) of a list of values."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def iter_samples(limit):
+    """Yields (image path, ground truth path, document type) for each image with ground truth."""
+    for data_dir in DATA_DIRS:
+        document_type = detect_document_type(os.path.basename(data_dir))
+        names = sorted(name for name in os.listdir(os.path.join(ROOT, data_dir)) if name.endswith("_in.jpg"))
+        for name in names[:limit]:
+            gt_path = os.path.join(ROOT, data_dir, name.replace("_in.jpg", "_gt_ocr.txt"))
+            if os.path.exists(gt_path):
+                yield os.path.join(ROOT, data_dir, name), gt_path, document_type
+
+
+def measure(payload, document_type, gt_path):
+    """OCRs and organizes one payload; returns (bytes, OCR seconds, accuracy)."""
+    start = time.perf_counter()
+    text = google_vision_extract(payload, use_cache=False)
+    latency = time.perf_counter() - start
+
+    visible_text = "\n".join(list_visible_information(text))
+    organized = organize_document(visible_text, document_type)["Informações Organizadas"]
+    scored = get_schema(document_type).scored_values(organized)
+    _, accuracy = check_field_accuracy(scored, extract_ground_truth_text(gt_path))
+    return len(payload), latency, accuracy
+
+
+def report(label, rows):
+    sizes, latencies, accuracies = zip(*rows)
+    print(
+        f"{label:<13} bytes mean={statistics.mean(sizes) / 1024:8.1f} KB  total={sum(sizes) / 1024 ** 2:7.2f} MB  "
+        f"OCR p50={percentile(latencies, 0.5) * 1000:7.1f} ms  p95={percentile(latencies, 0.95) * 1000:7.1f} ms  "
+        f"accuracy={statistics.mean(accuracies):6.2%}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--limit", type=int, default=20, help="Images per document type.")
+    parser.add_argument("--deskew", action="store_true", help="Also deskew preprocessed images.")
+    parser.add_argument("--crop", action="store_true", help="Also crop uniform borders.")
+    args = parser.parse_args()
+
+    raw, preprocessed = [], []
+    for image_path, gt_path, document_type in iter_samples(args.limit):
+        with open(image_path, "rb") as image_file:
+            content = image_file.read()
+        prepared = preprocess_for_ocr(
+            content, get_schema(document_type).ocr_max_side, deskew_text=args.deskew, crop=args.crop
+        )
+        raw.append(measure(content, document_type, gt_path))
+        preprocessed.append(measure(prepared, document_type, gt_path))
+
+    if not raw:
+        sys.exit("No images with ground truth found.")
+
+    print(f"{len(raw)} images")
+    report("as uploaded", raw)
+    report("preprocessed", preprocessed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Local stand-ins for Google Vision, OpenAI and pdf2image used by the offline benchmarks.
+
+Every stub has a configurable latency, error rate and fixtures, so pipeline
+performance can be measured without network access or API costs.
+"""
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+import types
+
+from doc_vision.google_vision import read_image
+from doc_vision.schemas import get_schema
+
+_FIELD_LINE = re.compile(r"^([^:\n]+):\s*(.*)$")
+
+
+class StubAPIError(Exception):
+    """Error raised by the stubs, carrying an HTTP status like the real SDK errors."""
+
+    def __init__(self, status_code, message="stub error"):
+        super().__init__(f"{status_code} {message}")
+        self.status_code = status_code
+
+
+class Behavior:
+    """
+    Latency and failure profile of a stub.
+
+    Args:
+        latency (float): Mean latency per call, in seconds.
+        jitter (float): Uniform latency variation, as a fraction of `latency`.
+        error_rate (float): Probability that a call fails.
+        error_status (int): HTTP status of the failures (429 and 5xx are retried by the rate limiter).
+        seed (int): Seed of the random generator, so runs are comparable.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.2, error_rate=0.0, error_status=503, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def random(self):
+        with self._lock:
+            return self._random.random()
+
+    def call(self):
+        """Sleeps for one call and raises when the call is drawn as a failure."""
+        if self.latency:
+            time.sleep(self.latency * (1 + self.jitter * (2 * self.random() - 1)))
+        if self.error_rate and self.random() < self.error_rate:
+            raise StubAPIError(self.error_status)
+
+
+def synthetic_fields(document_type, index):
+    """Returns deterministic field values for a synthetic document of the given type."""
+    values = {}
+    for field in get_schema(document_type).fields:
+        kind = get_schema(document_type).field_kind(field)
+        if kind == "text":
+            values[field] = f"{field.upper()} {index:05d}"
+        elif kind == "list":
+            values[field] = [f"{field.upper()} {index:05d} A", f"{field.upper()} {index:05d} B"]
+    return values
+
+
+def synthetic_text(values):
+    """Renders field values as OCR-like lines, plus some boilerplate."""
+    lines = ["REPUBLICA FEDERATIVA DO BRASIL", "VALIDA EM TODO O TERRITORIO NACIONAL"]
+    for field, value in values.items():
+        lines.append(f"{field}: {' / '.join(value) if isinstance(value, list) else value}")
+    return "\n".join(lines)
+
+
+def synthetic_image(index, size=200 * 1024):
+    """Returns unique JPEG-looking bytes of about `size` bytes."""
+    header = b"\xff\xd8\xff\xe0" + index.to_bytes(4, "big")
+    return header + hashlib.sha256(header).digest() * (size // 32)
+
+
+class StubVision:
+    """
+    Stand-in for google_vision_extract and google_vision_batch_extract.
+
+    Args:
+        fixtures (dict): SHA-256 of image bytes -> OCR text. Unknown images get "No text found.".
+        behavior (Behavior): Latency and failures per request.
+    """
+
+    def __init__(self, fixtures=None, behavior=None):
+        self.fixtures = fixtures if fixtures is not None else {}
+        self.behavior = behavior or Behavior()
+        self.requests = 0
+
+    def add(self, content, text):
+        self.fixtures[hashlib.sha256(content).hexdigest()] = text
+
+    def _text(self, image):
+        return self.fixtures.get(hashlib.sha256(read_image(image)).hexdigest(), "No text found.")
+
+    def extract(self, image, use_cache=True, image_context=None, content_hash=None):
+        self.requests += 1
+        self.behavior.call()
+        return self._text(image)
+
+    def batch_extract(self, images, use_cache=True, image_context=None, **kwargs):
+        self.requests += 1
+        try:
+            self.behavior.call()
+        except StubAPIError as e:
+            return [e] * len(images)
+        return [self._text(image) for image in images]
+
+
+def _answer(text, fields, behavior, disagreement):
+    """Fills the response format from "Field: value" lines, perturbing one field with some probability."""
+    found = {}
+    for line in text.splitlines():
+        match = _FIELD_LINE.match(line.strip())
+        if match:
+            found[match.group(1).strip().lower()] = match.group(2).strip()
+
+    answer = {}
+    for field, example in fields.items():
+        value = found.get(field.lower(), "")
+        if isinstance(example, list) and not (example and isinstance(example[0], dict)):
+            answer[field] = [part for part in value.split(" / ") if part]
+        elif isinstance(example, list):
+            answer[field] = []
+        else:
+            answer[field] = value
+
+    if disagreement and behavior.random() < disagreement:
+        text_fields = [field for field, value in answer.items() if isinstance(value, str) and value]
+        if text_fields:
+            field = text_fields[int(behavior.random() * len(text_fields))]
+            answer[field] += f" {int(behavior.random() * 3)}"
+    return answer
+
+
+class _Completions:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def create(self, model, messages, n=1, **options):
+        return self._owner.complete(messages[-1]["content"], n)
+
+
+class StubOpenAI:
+    """
+    Stand-in for the OpenAI client, registered with clients.set_client("openai", ...).
+
+    Answers are built from "Field: value" lines of the prompt's text, in the
+    response format given on the prompt's last line; packed prompts get an
+    answer per "### ID" section.
+
+    Args:
+        behavior (Behavior): Latency and failures per request.
+        disagreement (float): Probability that a completion perturbs one field,
+            so voting has something to decide.
+    """
+
+    def __init__(self, behavior=None, disagreement=0.0):
+        self.behavior = behavior or Behavior()
+        self.disagreement = disagreement
+        self.requests = 0
+        self.chat = types.SimpleNamespace(completions=_Completions(self))
+
+    def _content(self, prompt):
+        fields = json.loads(prompt.rstrip().splitlines()[-1])
+        sections = re.split(r"^### (\S+)$", prompt, flags=re.MULTILINE)
+        if len(sections) > 1:
+            answer = {
+                document_id: _answer(body, fields, self.behavior, self.disagreement)
+                for document_id, body in zip(sections[1::2], sections[2::2])
+            }
+        else:
+            answer = _answer(prompt, fields, self.behavior, self.disagreement)
+        return json.dumps(answer, ensure_ascii=False)
+
+    def complete(self, prompt, n=1):
+        self.requests += 1
+        self.behavior.call()
+        choices = [
+            types.SimpleNamespace(message=types.SimpleNamespace(content=self._content(prompt)))
+            for _ in range(n)
+        ]
+        return types.SimpleNamespace(choices=choices)
+
+
+class _StubPage:
+    """Rendered page: encodes to fixed bytes, so OCR finds its fixture."""
+
+    def __init__(self, content):
+        self.content = content
+        self.mode = "RGB"
+
+    def save(self, buffer, format=None, **options):
+        buffer.write(self.content)
+
+
+def install_pdf2image(pages, behavior=None):
+    """
+    Registers a fake `pdf2image` module rendering the given page bytes.
+
+    Args:
+        pages (list[bytes]): Encoded bytes each page renders to (page 1 first).
+        behavior (Behavior): Latency per rendered page.
+    """
+    behavior = behavior or Behavior()
+    module = types.ModuleType("pdf2image")
+    module.pdfinfo_from_bytes = lambda pdf_bytes: {"Pages": len(pages)}
+
+    def convert_from_bytes(pdf_bytes, dpi=200, first_page=1, last_page=None):
+        last_page = last_page or len(pages)
+        rendered = []
+        for page in range(first_page, last_page + 1):
+            behavior.call()
+            rendered.append(_StubPage(pages[page - 1]))
+        return rendered
+
+    module.convert_from_bytes = convert_from_bytes
+    sys.modules["pdf2image"] = module
+    return module
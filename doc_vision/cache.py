@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from . import replay
+
+CACHE_DIR = os.environ.get("DOC_VISION_CACHE_DIR", os.path.join(".cache", "doc_vision"))
+
+# Writes between two sweeps of expired entries, which also resync the size total with the database
+SWEEP_EVERY = 256
+
+# Entries deleted per statement when evicting
+EVICT_BATCH = 64
+
+
+def cache_disabled():
+    """
+    Returns True when caching is bypassed through the DOC_VISION_NO_CACHE environment variable,
+    or while API calls are recorded or replayed (see replay.active), so every call reaches the cassette.
+    """
+    return os.environ.get("DOC_VISION_NO_CACHE", "").lower() in ("1", "true", "yes") or replay.active()
+
+
+def make_key(*parts):
+    """
+    Builds a stable SHA-256 cache key from the given parts.
+
+    Args:
+        *parts: Strings, bytes or JSON-serializable values identifying the entry.
+
+    Returns:
+        str: Hex digest of the parts.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, (bytes, bytearray, memoryview)):
+            part = json.dumps(part, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        digest.update(hashlib.sha256(part).digest())
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """
+    Persistent key/value store backed by SQLite, bounded by size with LRU and TTL eviction.
+
+    The total size is kept as a running count, so a write only touches the
+    database to evict when the cap is exceeded. Expired entries are swept every
+    SWEEP_EVERY writes (a read never returns one), and both evictions delete
+    EVICT_BATCH entries at a time through the `accessed` and `created` indexes.
+
+    Args:
+        path (str): SQLite database file.
+        max_bytes (int): Maximum total size of the stored values.
+        ttl (float | None): Seconds after which an entry expires. None keeps entries forever.
+    """
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, ttl=None):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_created ON entries (created)")
+        self._conn.commit()
+        self._writes = 0
+        self._size = self._total_size()
+
+    def _total_size(self):
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def get(self, key):
+        """
+        Returns the cached value for a key, or None when missing or expired.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created, size FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+                if row is not None:
+                    self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    self._conn.commit()
+                    self._size -= row[2]
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        """
+        Stores a JSON-serializable value and evicts the least recently used entries over the size cap.
+        """
+        data = json.dumps(value, ensure_ascii=False)
+        size = len(data.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, data, size, now, now),
+            )
+            self._size += size - (old[0] if old else 0)
+            self._writes += 1
+            if self._writes % SWEEP_EVERY == 0:
+                self._sweep()
+            if self._size > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _delete_batches(self, query, params, done):
+        """Deletes the entries selected by `query`, EVICT_BATCH at a time, until `done()` or none are left."""
+        while not done():
+            rows = self._conn.execute(f"{query} LIMIT {EVICT_BATCH}", params).fetchall()
+            if not rows:
+                break
+            keys = []
+            for key, size in rows:
+                keys.append((key,))
+                self._size -= size
+                if done():
+                    break
+            self._conn.executemany("DELETE FROM entries WHERE key = ?", keys)
+
+    def _sweep(self):
+        # Other processes may share the database file, so the running total is refreshed here
+        self._size = self._total_size()
+        if self.ttl is not None:
+            self._delete_batches(
+                "SELECT key, size FROM entries WHERE created < ? ORDER BY created", (time.time() - self.ttl,),
+                lambda: False,
+            )
+
+    def _evict(self):
+        self._delete_batches(
+            "SELECT key, size FROM entries ORDER BY accessed", (), lambda: self._size <= self.max_bytes
+        )
+
+    def clear(self):
+        """Removes every entry and resets the counters."""
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+            self._size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Returns the hit/miss counters and current size of the cache.
+        """
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name, **kwargs):
+    """
+    Returns the process-wide cache with the given name, creating it on first use.
+
+    Args:
+        name (str): Cache name, also used as the database file name.
+        **kwargs: Options forwarded to DiskCache on creation.
+
+    Returns:
+        DiskCache: The shared cache instance.
+    """
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = DiskCache(os.path.join(CACHE_DIR, f"{name}.sqlite3"), **kwargs)
+        return _caches[name]
@@ -0,0 +1,125 @@
+import json
+import os
+import threading
+
+CONFIG_PATH = os.environ.get("DOC_VISION_CONFIG", "config.json")
+
+# Maximum pooled HTTP connections for the OpenAI client and document downloads, sized for the pipeline workers
+HTTP_POOL_SIZE = int(os.environ.get("DOC_VISION_HTTP_POOL", "20"))
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def load_config():
+    """
+    Loads the JSON configuration file with the API keys.
+
+    Returns:
+        dict: The configuration.
+    """
+    with open(CONFIG_PATH, "r") as config_file:
+        return json.load(config_file)
+
+
+def _create_vision_client():
+    from google.cloud import vision
+    return vision.ImageAnnotatorClient()
+
+
+def _create_language_client():
+    from google.cloud import language_v1
+    return language_v1.LanguageServiceClient()
+
+
+def _create_openai_client():
+    import httpx
+    from openai import OpenAI
+
+    http_client = httpx.Client(
+        limits=httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE)
+    )
+    # Retries are left to the shared rate limiter, which must see every 429/5xx to adapt
+    return OpenAI(api_key=load_config()["openai_api_key"], http_client=http_client, max_retries=0)
+
+
+def _create_http_session():
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    # Only connection failures are retried; a partially read body is never re-requested silently
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE,
+        max_retries=Retry(total=3, connect=3, read=0, status=0, backoff_factor=0.5),
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+_factories = {
+    "vision": _create_vision_client,
+    "language": _create_language_client,
+    "openai": _create_openai_client,
+    "http": _create_http_session,
+}
+
+
+def get_client(name):
+    """
+    Returns the process-wide client for an API, creating it on first use.
+
+    Clients are thread-safe and keep their gRPC channel or HTTP keep-alive
+    connections open, so every call after the first skips the connection and
+    auth handshake.
+
+    Args:
+        name (str): One of "vision", "language", "openai" or "http".
+
+    Returns:
+        The shared client instance.
+    """
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _factories[name]()
+                _clients[name] = client
+    return client
+
+
+def set_client(name, client):
+    """
+    Replaces the shared client for an API (e.g. with a stub in benchmarks).
+    """
+    with _lock:
+        _clients[name] = client
+
+
+def reset_clients():
+    """Drops every shared client so the next call creates new ones."""
+    with _lock:
+        _clients.clear()
+
+
+def get_vision_client():
+    """Returns the shared Google Vision client."""
+    return get_client("vision")
+
+
+def get_language_client():
+    """Returns the shared Google Natural Language client."""
+    return get_client("language")
+
+
+def get_openai_client():
+    """Returns the shared OpenAI client."""
+    return get_client("openai")
+
+
+def get_http_session():
+    """Returns the shared requests session used for document downloads."""
+    return get_client("http")
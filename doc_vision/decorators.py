@@ -3,6 +3,7 @@ import unicodedata
 import re
 from typing import Callable
 from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from difflib import SequenceMatcher
 
 def normalize_text(text):
@@ -88,7 +89,94 @@ def has_valid_data(json_data):
         return False
     return any(json_data.values())  # Returns True if any field is non-empty
 
-def vote(n: int, threshold: float = 0.3):
+def decide(votes, threshold: float = 0.3):
+    """
+    Picks the winning result among normalized ballots.
+
+    Args:
+        votes (list[str]): Ballots as sorted JSON strings.
+        threshold (float): Minimum percentage required for a result to be considered valid.
+
+    Returns:
+        The decoded winning result, or an empty JSON if there are no ballots.
+    """
+    if not votes:
+        return {}  # Return empty JSON if no valid data
+
+    # Count occurrences of results
+    groups = Counter(votes)
+
+    # Sort by frequency
+    votes_results = groups.most_common()
+    
+    # Compute the percentage of the most frequent vote
+    total_votes = sum(groups.values())
+    top_result, top_count = votes_results[0]
+    top_percentage = top_count / total_votes
+
+    # If majority (>50%) is found, return the result
+    if top_percentage > 0.5:
+        return json.loads(top_result)
+
+    # If at least 30% agreement, accept as valid
+    if top_percentage >= threshold:
+        return json.loads(top_result)
+
+    # If no consensus, choose the most similar result to the top vote
+    best_match = max(votes_results, key=lambda item: similarity(item[0], top_result))
+    return json.loads(best_match[0])
+
+def ballot(result):
+    """
+    Normalizes a result into a ballot.
+
+    Returns:
+        str | None: The normalized result as a sorted JSON string, or None if it has no valid data.
+    """
+    normalized_result = normalize_json(result)  # Normalize the result
+    if has_valid_data(normalized_result):  # Only count it if it has valid data
+        return json.dumps(normalized_result, sort_keys=True)  # Convert to sorted JSON string
+    return None
+
+def vote_candidates(candidates, threshold: float = 0.3):
+    """
+    Returns the most consistent result among already generated candidates.
+
+    Applies the same normalization and decision rules as `vote`, for results
+    produced together (e.g. the `n` choices of a single GPT completion).
+
+    Args:
+        candidates (list): Candidate results.
+        threshold (float): Minimum percentage required for a result to be considered valid.
+
+    Returns:
+        The winning result, or an empty JSON if no candidate has valid data.
+    """
+    votes = [normalized for normalized in map(ballot, candidates) if normalized is not None]
+    return decide(votes, threshold)
+
+def quorum_reached(votes, n: int, threshold: float, cast: int):
+    """
+    Checks whether the remaining runs can no longer change the outcome of a vote.
+
+    Args:
+        votes (list[str]): Valid ballots collected so far.
+        n (int): Total number of runs.
+        threshold (float): Minimum percentage required for a result to be considered valid.
+        cast (int): Runs finished so far, including the ones without valid data.
+
+    Returns:
+        bool: True if the leading ballot has an unbeatable majority or already
+        holds `threshold` of all `n` runs.
+    """
+    if not votes:
+        return False
+    counts = Counter(votes).most_common(2)
+    top_count = counts[0][1]
+    runner_up = counts[1][1] if len(counts) > 1 else 0
+    return top_count > runner_up + (n - cast) or top_count >= threshold * n
+
+def vote(n: int, threshold: float = 0.3, max_workers: int = None, early_stop: bool = True):
     """
     Decorator that runs a function multiple times and returns the most consistent result.
     
@@ -97,12 +185,20 @@ def vote(n: int, threshold: float = 0.3):
     - If no result reaches 30%, selects the JSON most similar to the most voted one.
     - Avoids empty JSONs, ensuring at least one valid field.
     - Increases the chance of recovering problematic documents.
+    - Runs the executions concurrently and stops as soon as the outcome is settled.
     
     Reduces discards and improves consistency of results.
     
     Args:
         n (int): Number of times the function should be executed.
         threshold (float): Minimum percentage required for a result to be considered valid.
+        max_workers (int): Maximum concurrent executions. Defaults to a majority
+            of n (n // 2 + 1) with early_stop, so a vote settled by the first runs
+            never starts the others; to n otherwise.
+        early_stop (bool): If True, returns once one result has an unbeatable
+            majority or reaches the threshold, without starting the remaining runs.
+            Runs already in flight keep going in the background, and their results
+            and exceptions are discarded.
     
     Returns:
         Callable: The decorated function.
@@ -113,43 +209,29 @@ def vote(n: int, threshold: float = 0.3):
     def vote_decorator(f: Callable):
         def wrapper(*args, **kwargs):
             votes = []
-            
-            def apply_and_vote(idx: int, args: list, kwargs: dict):
-                """Executes the function and adds the normalized result to the voting pool."""
-                result = f(*args, **kwargs)
-                normalized_result = normalize_json(result)  # Normalize the result
-                
-                if has_valid_data(normalized_result):  # Only add if it has valid data
-                    votes.append(json.dumps(normalized_result, sort_keys=True))  # Convert to sorted JSON string
-            
-            for i in range(n):
-                apply_and_vote(i, args, kwargs)
-
-            if not votes:
-                return {}  # Return empty JSON if no valid data
-
-            # Count occurrences of results
-            groups = Counter(votes)
-
-            # Sort by frequency
-            votes_results = groups.most_common()
-            
-            # Compute the percentage of the most frequent vote
-            total_votes = sum(groups.values())
-            top_result, top_count = votes_results[0]
-            top_percentage = top_count / total_votes
-
-            # If majority (>50%) is found, return the result
-            if top_percentage > 0.5:
-                return json.loads(top_result)
-
-            # If at least 30% agreement, accept as valid
-            if top_percentage >= threshold:
-                return json.loads(top_result)
-
-            # If no consensus, choose the most similar result to the top vote
-            best_match = max(votes_results, key=lambda item: similarity(item[0], top_result))
-            return json.loads(best_match[0])
+            workers = min(n, max_workers or (n // 2 + 1 if early_stop else n))
+            executor = ThreadPoolExecutor(max_workers=workers)
+            try:
+                # A run is submitted only when a worker frees up, so none is queued once the vote is settled
+                pending = {executor.submit(f, *args, **kwargs) for _ in range(workers)}
+                submitted, cast = workers, 0
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        cast += 1
+                        normalized = ballot(future.result())
+                        if normalized is not None:
+                            votes.append(normalized)
+                    if early_stop and quorum_reached(votes, n, threshold, cast):
+                        break
+                    while submitted < n and len(pending) < workers:
+                        pending.add(executor.submit(f, *args, **kwargs))
+                        submitted += 1
+            finally:
+                # Runs already in flight finish in the background
+                executor.shutdown(wait=False)
+
+            return decide(votes, threshold)
 
         return wrapper
-    return vote_decorator
\ No newline at end of file
+    return vote_decorator
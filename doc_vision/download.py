@@ -0,0 +1,107 @@
+import hashlib
+import os
+from .clients import get_http_session
+from .tracing import span
+
+# Seconds to establish a connection and between two received chunks
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+
+# Largest document accepted; override with DOC_VISION_MAX_DOWNLOAD_MB
+MAX_DOWNLOAD_BYTES = int(float(os.environ.get("DOC_VISION_MAX_DOWNLOAD_MB", "25")) * 1024 * 1024)
+
+CHUNK_SIZE = 64 * 1024
+
+# Leading bytes identifying the formats we accept
+_SIGNATURES = (
+    (b"%PDF-", "pdf"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+    (b"BM", "bmp"),
+)
+
+
+def sniff_kind(head):
+    """
+    Identifies a document format from its first bytes.
+
+    Args:
+        head (bytes): The beginning of the file (at least 12 bytes for WEBP).
+
+    Returns:
+        str | None: "pdf", "jpeg", "png", "gif", "webp", "tiff", "bmp", or None if unknown.
+    """
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    for signature, kind in _SIGNATURES:
+        if head.startswith(signature):
+            return kind
+    return None
+
+
+class Download:
+    """
+    A downloaded document.
+
+    Args:
+        content (bytes): The document bytes.
+        kind (str | None): Format sniffed from the bytes (see sniff_kind).
+        sha256 (str): Hex digest of the content, computed while streaming.
+        content_type (str | None): The Content-Type announced by the server.
+    """
+
+    def __init__(self, content, kind, sha256, content_type=None):
+        self.content = content
+        self.kind = kind
+        self.sha256 = sha256
+        self.content_type = content_type
+
+    @property
+    def is_pdf(self):
+        return self.kind == "pdf"
+
+
+@span("download")
+def download_document(url, max_bytes=MAX_DOWNLOAD_BYTES, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), session=None):
+    """
+    Streams a document into memory with the shared HTTP session.
+
+    The body is read in chunks and hashed as it arrives, so the content hash
+    is ready when the download completes. Downloads announced or found to be
+    larger than `max_bytes` are aborted without reading the rest.
+
+    Args:
+        url (str): The document URL.
+        max_bytes (int): Largest accepted body.
+        timeout (tuple[float, float]): Connect and read timeouts, in seconds.
+        session: requests-compatible session. Defaults to the shared pooled one.
+
+    Returns:
+        Download: The content, its sniffed format and its SHA-256.
+
+    Raises:
+        requests.RequestException: On connection errors, timeouts or an HTTP error status.
+        ValueError: If the document is larger than `max_bytes`.
+    """
+    session = session or get_http_session()
+    with session.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+
+        length = response.headers.get("Content-Length")
+        if length and length.isdigit() and int(length) > max_bytes:
+            raise ValueError(f"Documento maior que o limite de {max_bytes} bytes ({length} bytes).")
+
+        digest = hashlib.sha256()
+        buffer = bytearray()
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            buffer += chunk
+            if len(buffer) > max_bytes:
+                raise ValueError(f"Documento maior que o limite de {max_bytes} bytes.")
+            digest.update(chunk)
+
+        content = bytes(buffer)
+        return Download(content, sniff_kind(content[:16]), digest.hexdigest(), response.headers.get("Content-Type"))
@@ -1,27 +1,247 @@
-from google.cloud import vision
+import hashlib
 import io
+from .cache import cache_disabled, get_cache, make_key
+from .clients import get_vision_client
+from .ratelimit import get_limiter
+from .replay import recorded, recorded_items
+from .tracing import span
+from . import metrics
 
-def google_vision_extract(image_path):
+# Vision feature used for OCR; part of the cache key so other features never collide
+OCR_FEATURE = "TEXT_DETECTION"
+
+# Per-request limits of images:batchAnnotate
+MAX_IMAGES_PER_REQUEST = 16
+MAX_REQUEST_BYTES = 10 * 1024 * 1024
+
+def get_ocr_cache():
+    """Returns the on-disk OCR cache (512 MB, entries expire after 90 days)."""
+    return get_cache("ocr", max_bytes=512 * 1024 * 1024, ttl=90 * 24 * 3600)
+
+def read_image(image):
     """
-    Uses the Google Vision API to extract text from an image.
-    
+    Returns the bytes of an image given as a path, raw bytes or a file-like object.
+
     Args:
-        image_path (str): The file path of the image to be processed.
-    
+        image (str | os.PathLike | bytes | bytearray | memoryview | IO[bytes]): The image.
+
     Returns:
-        str: Extracted text from the image or a message indicating no text was found.
-    
-    Raises:
-        Exception: If an API error occurs.
+        bytes: The encoded image, untouched.
     """
-    client = vision.ImageAnnotatorClient()
-    with io.open(image_path, 'rb') as image_file:
-        content = image_file.read()
+    if isinstance(image, bytes):
+        return image
+    if isinstance(image, (bytearray, memoryview)):
+        return bytes(image)
+    if hasattr(image, "read"):
+        return image.read()
+    with io.open(image, 'rb') as image_file:
+        return image_file.read()
+
+def _ocr_cache_key(content, image_context, content_hash=None):
+    return make_key(content_hash or hashlib.sha256(content).hexdigest(), OCR_FEATURE, image_context or {})
+
+def _detect_text(content, image_context):
+    """Calls Vision text detection for one image and returns its text."""
+    from google.cloud import vision  # Deferred: the SDK is slow to import
+
+    client = get_vision_client()
     image = vision.Image(content=content)
-    response = client.text_detection(image=image)
-    
+    # retry=None: the rate limiter is the only retry layer
+    if image_context:
+        response = get_limiter("vision").call(client.text_detection, image=image, image_context=image_context,
+                                              retry=None)
+    else:
+        response = get_limiter("vision").call(client.text_detection, image=image, retry=None)
+    return _response_text(response)
+
+def _annotate_batch(client, contents, image_context):
+    """
+    Calls Vision batch annotation for several images.
+
+    An injected client receives plain dict requests, so a fake backend works without the SDK.
+
+    Returns, for each image, its text or the Exception raised for it.
+    """
+    if client is None:
+        from google.cloud import vision  # Deferred: the SDK is slow to import
+
+        client = get_vision_client()
+        feature = vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)
+        requests = [
+            vision.AnnotateImageRequest(
+                image=vision.Image(content=content), features=[feature], image_context=image_context
+            )
+            for content in contents
+        ]
+    else:
+        requests = [
+            {"image": {"content": content}, "features": [{"type_": OCR_FEATURE}], "image_context": image_context}
+            for content in contents
+        ]
+    # Vision quotas count images, not HTTP requests; retry=None leaves retries to the rate limiter
+    response = get_limiter("vision").call(client.batch_annotate_images, cost=len(requests), requests=requests,
+                                          retry=None)
+
+    responses = list(response.responses)
+    results = []
+    for position in range(len(contents)):
+        if position >= len(responses):
+            results.append(Exception("API Error: missing response for image in batch"))
+            continue
+        try:
+            results.append(_response_text(responses[position]))
+        except Exception as e:
+            results.append(e)
+    return results
+
+def _response_text(response):
+    """Returns the full text of an annotate response, raising on API errors."""
     if response.error.message:
         raise Exception(f"API Error: {response.error.message}")
-    
+
     texts = response.text_annotations
     return texts[0].description if texts else "No text found."
+
+def google_vision_extract(image, use_cache=True, image_context=None, content_hash=None):
+    """
+    Uses the Google Vision API to extract text from an image.
+
+    Results are cached on disk by the SHA-256 of the image bytes, the Vision
+    feature and the request options, so an image already seen is never sent again.
+
+    Args:
+        image (str | bytes | memoryview | IO[bytes]): The image file path, or the encoded
+            image itself, sent to the API as it is.
+        use_cache (bool): If False, bypasses the OCR cache and always calls the API.
+        image_context (dict | None): Optional Vision image context (e.g. language hints).
+        content_hash (str | None): SHA-256 hex digest of the image bytes, if already
+            known (e.g. computed while downloading), so they are not hashed again.
+
+    Returns:
+        str: Extracted text from the image or a message indicating no text was found.
+
+    Raises:
+        Exception: If an API error occurs.
+    """
+    content = read_image(image)
+
+    use_cache = use_cache and not cache_disabled()
+    if use_cache:
+        cache = get_ocr_cache()
+        key = _ocr_cache_key(content, image_context, content_hash)
+        cached = cache.get(key)
+        if cached is not None:
+            metrics.increment("ocr_cache_hits")
+            return cached
+
+    metrics.increment("vision_requests")
+    request = {"feature": OCR_FEATURE, "image": content_hash or hashlib.sha256(content).hexdigest(),
+               "image_context": image_context or {}}
+    with span("vision_ocr", images=1):
+        text = recorded("vision", request, lambda: _detect_text(content, image_context))
+
+    if use_cache:
+        cache.set(key, text)
+    return text
+
+def plan_batches(sizes, max_images=MAX_IMAGES_PER_REQUEST, max_bytes=MAX_REQUEST_BYTES):
+    """
+    Groups images into batches that respect both the image count and payload size limits.
+
+    Image bytes are counted as base64, the way they are sent to the API. An image
+    larger than max_bytes on its own still gets a batch of its own.
+
+    Args:
+        sizes (list[int]): Size in bytes of each image.
+        max_images (int): Maximum images per request.
+        max_bytes (int): Maximum encoded payload per request.
+
+    Returns:
+        list[list[int]]: Indexes into `sizes`, one list per request.
+    """
+    batches = []
+    current = []
+    current_bytes = 0
+    for index, size in enumerate(sizes):
+        encoded = 4 * ((size + 2) // 3)
+        if current and (len(current) >= max_images or current_bytes + encoded > max_bytes):
+            batches.append(current)
+            current = []
+            current_bytes = 0
+        current.append(index)
+        current_bytes += encoded
+    if current:
+        batches.append(current)
+    return batches
+
+def google_vision_batch_extract(images, use_cache=True, image_context=None, client=None,
+                                max_images=MAX_IMAGES_PER_REQUEST, max_bytes=MAX_REQUEST_BYTES):
+    """
+    Extracts text from many images with as few `batch_annotate_images` requests as possible.
+
+    Cached images are not sent. An error on one image (API error for that image
+    or a failed request) is returned in its slot instead of failing the others.
+
+    Args:
+        images (list): File paths or encoded images (bytes, memoryview or file-like) to be processed.
+        use_cache (bool): If False, bypasses the OCR cache and always calls the API.
+        image_context (dict | None): Optional Vision image context applied to every image.
+        client: Vision client to use. Defaults to the shared client; pass a fake backend for testing.
+            A fake needs only `batch_annotate_images(requests, retry)`, which gets dicts
+            {"image": {"content": bytes}, "features": [{"type_": "TEXT_DETECTION"}], "image_context": ...}
+            and returns an object whose `responses` have `error.message` and `text_annotations`.
+        max_images (int): Maximum images per request.
+        max_bytes (int): Maximum encoded payload per request.
+
+    Returns:
+        list: For each input image, in order, the extracted text or the Exception raised for it.
+    """
+    use_cache = use_cache and not cache_disabled()
+    cache = get_ocr_cache() if use_cache else None
+    results = [None] * len(images)
+    pending = []  # (index, content, cache key)
+
+    for index, image in enumerate(images):
+        try:
+            content = read_image(image)
+        except OSError as e:
+            results[index] = e
+            continue
+        key = _ocr_cache_key(content, image_context) if use_cache else None
+        cached = cache.get(key) if use_cache else None
+        if cached is not None:
+            metrics.increment("ocr_cache_hits")
+            results[index] = cached
+        else:
+            pending.append((index, content, key))
+
+    if not pending:
+        return results
+
+    for batch in plan_batches([len(content) for _, content, _ in pending], max_images, max_bytes):
+        items = [pending[i] for i in batch]
+        contents = [content for _, content, _ in items]
+        # Recorded per image, like google_vision_extract records it, so a replay
+        # serves them whatever batches the pipeline forms
+        requests = [
+            {"feature": OCR_FEATURE, "image": hashlib.sha256(content).hexdigest(), "image_context": image_context or {}}
+            for content in contents
+        ]
+
+        metrics.increment("vision_requests")
+        try:
+            with span("vision_ocr", images=len(contents)):
+                texts = recorded_items("vision", requests, lambda: _annotate_batch(client, contents, image_context))
+        except Exception as e:
+            for index, _, _ in items:
+                results[index] = e
+            continue
+
+        for (index, _, key), text in zip(items, texts):
+            results[index] = text
+            if isinstance(text, Exception):
+                continue
+            if use_cache:
+                cache.set(key, results[index])
+
+    return results
@@ -0,0 +1,217 @@
+import io
+import os
+from .tracing import span
+
+# Leading bytes of the formats forwarded to Google Vision as they are
+_FORWARDED_SIGNATURES = (
+    b"\xff\xd8\xff",  # JPEG
+    b"\x89PNG\r\n\x1a\n",  # PNG
+)
+
+# Shrinks images before OCR; enable with DOC_VISION_PREPROCESS=1. Off by default until
+# benchmarks/bench_preprocessing.py shows it costs no field accuracy
+PREPROCESS = os.environ.get("DOC_VISION_PREPROCESS", "").lower() in ("1", "true", "yes")
+
+# Optional steps, off by default since they only pay off on photos
+DESKEW = os.environ.get("DOC_VISION_DESKEW", "").lower() in ("1", "true", "yes")
+CROP_BORDERS = os.environ.get("DOC_VISION_CROP_BORDERS", "").lower() in ("1", "true", "yes")
+
+# Largest encoded image produced by preprocessing
+MAX_UPLOAD_BYTES = 1024 * 1024
+
+# JPEG qualities tried in order until the image fits MAX_UPLOAD_BYTES
+JPEG_QUALITIES = (90, 80, 70, 60)
+
+# Skew angles searched by deskew, in degrees
+MAX_SKEW = 5.0
+SKEW_STEP = 0.25
+
+
+def is_forwardable(data):
+    """Returns True if the bytes are already a JPEG or PNG image that Vision accepts as is."""
+    return bytes(data[:8]).startswith(_FORWARDED_SIGNATURES)
+
+
+def encode_jpeg(image, quality=95):
+    """
+    Encodes a PIL image as JPEG in memory.
+
+    Args:
+        image (PIL.Image.Image): The image. Grayscale images stay single-channel.
+        quality (int): JPEG quality.
+
+    Returns:
+        bytes: The encoded image.
+    """
+    if image.mode not in ("L", "RGB"):
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+@span("image_decode")
+def to_image_bytes(data):
+    """
+    Prepares an uploaded image for OCR without touching the disk.
+
+    JPEG and PNG input is returned untouched, avoiding a decode and a lossy
+    recompression. Other formats (e.g. TIFF, HEIC through a Pillow plugin) are
+    decoded and converted to JPEG in memory.
+
+    Args:
+        data (bytes | memoryview): The uploaded file content.
+
+    Returns:
+        bytes: An image Google Vision accepts.
+    """
+    if is_forwardable(data):
+        return data if isinstance(data, bytes) else bytes(data)
+
+    from PIL import Image  # Deferred: only uploads in other formats need it
+
+    with Image.open(io.BytesIO(data)) as image:
+        return encode_jpeg(image)
+
+
+def crop_borders(image, tolerance=30, margin=0.02):
+    """
+    Crops uniform borders (scanner bed, table) around the document.
+
+    The background is the median of the outermost pixels; rows and columns
+    with almost no pixel differing from it are trimmed.
+
+    Args:
+        image (PIL.Image.Image): Grayscale image.
+        tolerance (int): Gray-level difference that counts as content.
+        margin (float): Fraction of the size kept around the content.
+
+    Returns:
+        PIL.Image.Image: The cropped image, or the same image if the content
+        box looks implausible (less than a fifth of the image).
+    """
+    import numpy as np  # Deferred: only preprocessing needs it
+
+    pixels = np.asarray(image, dtype=np.int16)
+    edges = np.concatenate([pixels[0], pixels[-1], pixels[:, 0], pixels[:, -1]])
+    content = np.abs(pixels - np.median(edges)) > tolerance
+
+    rows = np.flatnonzero(content.mean(axis=1) > 0.01)
+    columns = np.flatnonzero(content.mean(axis=0) > 0.01)
+    if not len(rows) or not len(columns):
+        return image
+
+    height, width = pixels.shape
+    top, bottom = rows[0], rows[-1] + 1
+    left, right = columns[0], columns[-1] + 1
+    if (bottom - top) * (right - left) < 0.2 * height * width:
+        return image
+
+    pad_y, pad_x = int(height * margin), int(width * margin)
+    return image.crop((
+        max(0, left - pad_x), max(0, top - pad_y), min(width, right + pad_x), min(height, bottom + pad_y)
+    ))
+
+
+def estimate_skew(image, max_angle=MAX_SKEW, step=SKEW_STEP):
+    """
+    Estimates the clockwise skew of text lines with a projection profile.
+
+    Dark pixels of a reduced copy are projected on the vertical axis for each
+    candidate angle; the angle whose profile is sharpest aligns the text lines.
+
+    Args:
+        image (PIL.Image.Image): Grayscale image.
+        max_angle (float): Largest skew searched, in degrees.
+        step (float): Angle resolution, in degrees.
+
+    Returns:
+        float: The skew in degrees; rotating the image counter-clockwise by it straightens the text.
+    """
+    import numpy as np  # Deferred: only preprocessing needs it
+
+    small = image.copy()
+    small.thumbnail((800, 800))
+    pixels = np.asarray(small, dtype=np.float32)
+    ys, xs = np.nonzero(pixels < pixels.mean() - pixels.std())
+    if len(ys) < 100:
+        return 0.0
+
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-max_angle, max_angle + step / 2, step):
+        radians = np.deg2rad(angle)
+        projected = np.round(ys * np.cos(radians) - xs * np.sin(radians)).astype(np.int64)
+        profile = np.bincount(projected - projected.min())
+        score = float(np.dot(profile, profile))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def deskew(image):
+    """Rotates the image so its text lines are horizontal."""
+    from PIL import Image  # Deferred: only preprocessing needs it
+
+    angle = estimate_skew(image)
+    if abs(angle) < SKEW_STEP:
+        return image
+    return image.rotate(angle, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=255)
+
+
+def encode_bounded(image, max_bytes=MAX_UPLOAD_BYTES):
+    """
+    Encodes an image as JPEG no larger than `max_bytes`, lowering the quality
+    first and the resolution only when the lowest quality is not enough.
+
+    Returns:
+        bytes: The encoded image.
+    """
+    from PIL import Image  # Deferred: only preprocessing needs it
+
+    while True:
+        for quality in JPEG_QUALITIES:
+            data = encode_jpeg(image, quality)
+            if len(data) <= max_bytes:
+                return data
+        if max(image.size) <= 800:
+            return data
+        image = image.resize((image.width * 3 // 4, image.height * 3 // 4), Image.Resampling.LANCZOS)
+
+
+@span("image_preprocess")
+def preprocess_for_ocr(image, max_side, deskew_text=None, crop=None, max_bytes=MAX_UPLOAD_BYTES):
+    """
+    Shrinks an image for OCR: downscale, grayscale, contrast normalization,
+    optional border crop and deskew, and a size-bounded JPEG encoding.
+
+    Args:
+        image (bytes | PIL.Image.Image): Encoded image or an already decoded one (e.g. a PDF page).
+        max_side (int): Longest side in pixels after downscaling.
+        deskew_text (bool | None): Straighten skewed text. Defaults to DOC_VISION_DESKEW.
+        crop (bool | None): Crop uniform borders. Defaults to DOC_VISION_CROP_BORDERS.
+        max_bytes (int): Largest encoded size.
+
+    Returns:
+        bytes: The image to send to Vision. Encoded input that is already a
+        JPEG or PNG no larger than the result is returned untouched.
+    """
+    from PIL import Image, ImageOps  # Deferred: only preprocessing needs it
+
+    original = None
+    if not isinstance(image, Image.Image):
+        original = bytes(image)
+        image = ImageOps.exif_transpose(Image.open(io.BytesIO(original)))
+
+    image = image.convert("L")
+    if CROP_BORDERS if crop is None else crop:
+        image = crop_borders(image)
+    # Downscaled before deskewing so the rotation works on fewer pixels
+    image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    if DESKEW if deskew_text is None else deskew_text:
+        image = deskew(image)
+    image = ImageOps.autocontrast(image, cutoff=1)
+
+    data = encode_bounded(image, max_bytes)
+    if original is not None and is_forwardable(original) and len(original) <= len(data):
+        return original
+    return data
@@ -0,0 +1,124 @@
+import json
+import re
+from . import metrics
+
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL | re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+
+def _close_truncated(text):
+    """
+    Completes a truncated JSON document, keeping only the members it holds in full.
+
+    The unfinished trailing member (a string, number or key cut off mid-way) is
+    dropped rather than closed, since a partial value (e.g. half a CPF) would
+    look valid. The arrays and objects left open are then closed.
+    """
+    stack = []  # [closer, in_value] of each open array or object
+    in_string = False
+    escaped = False
+    cut, cut_stack = None, []  # End of the last complete member, and the containers open there
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+                if stack and (stack[-1][0] == "]" or stack[-1][1]):
+                    cut, cut_stack = index + 1, [closer for closer, _ in stack]
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append(["}" if char == "{" else "]", False])
+            cut, cut_stack = index + 1, [closer for closer, _ in stack]
+        elif char in "}]" and stack:
+            stack.pop()
+            cut, cut_stack = index + 1, [closer for closer, _ in stack]
+        elif char == ":" and stack:
+            stack[-1][1] = True
+        elif char == "," and stack:
+            # The comma ends the previous member, e.g. a number or literal
+            cut, cut_stack = index, [closer for closer, _ in stack]
+            stack[-1][1] = False
+
+    if cut is None:
+        return text
+    return text[:cut].rstrip().rstrip(",") + "".join(reversed(cut_stack))
+
+
+def repair_json(text):
+    """
+    Recovers a JSON object from a model answer with prose, code fences,
+    trailing commas or a truncated ending.
+
+    Args:
+        text (str): Raw model answer.
+
+    Returns:
+        The decoded JSON value.
+
+    Raises:
+        ValueError: If no JSON object can be recovered.
+    """
+    fenced = _FENCE.search(text)
+    if fenced:
+        text = fenced.group(1)
+
+    start = text.find("{")
+    if start == -1:
+        raise ValueError("No JSON object found in the response")
+
+    # The object ends where the decoder stops, whatever prose (even with braces) follows it
+    decoder = json.JSONDecoder()
+    for candidate in (text[start:], _TRAILING_COMMA.sub(r"\1", text[start:])):
+        try:
+            return decoder.raw_decode(candidate)[0]
+        except ValueError:
+            continue
+
+    end = text.rfind("}")
+    candidates = [text[start:end + 1]] if end > start else []
+    candidates.append(text[start:])
+
+    for candidate in candidates:
+        candidate = _TRAILING_COMMA.sub(r"\1", candidate)
+        for attempt in (candidate, _close_truncated(candidate)):
+            try:
+                return json.loads(_TRAILING_COMMA.sub(r"\1", attempt))
+            except ValueError:
+                continue
+    raise ValueError("Could not repair the JSON response")
+
+
+def parse_json_response(text):
+    """
+    Parses a model answer as JSON, repairing it locally before giving up.
+
+    Counts "json_parsed", "json_repaired" (API round trips avoided) and
+    "json_parse_failures" in doc_vision.metrics.
+
+    Args:
+        text (str): Raw model answer.
+
+    Returns:
+        The decoded JSON value.
+
+    Raises:
+        ValueError: If the answer cannot be parsed nor repaired.
+    """
+    try:
+        value = json.loads(text)
+        metrics.increment("json_parsed")
+        return value
+    except (TypeError, ValueError):
+        pass
+
+    try:
+        value = repair_json(text or "")
+    except ValueError:
+        metrics.increment("json_parse_failures")
+        raise
+    metrics.increment("json_repaired")
+    return value
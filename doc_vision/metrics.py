@@ -0,0 +1,40 @@
+import threading
+from collections import Counter
+
+_counters = Counter()
+_lock = threading.Lock()
+
+
+def increment(name, amount=1):
+    """
+    Increments a process-wide counter.
+
+    Args:
+        name (str): Counter name (e.g. "vision_requests").
+        amount (int): Value to add.
+    """
+    with _lock:
+        _counters[name] += amount
+
+
+def get(name):
+    """Returns the current value of a counter."""
+    with _lock:
+        return _counters[name]
+
+
+def snapshot():
+    """
+    Returns a copy of every counter.
+
+    Returns:
+        dict: Counter name -> value.
+    """
+    with _lock:
+        return dict(_counters)
+
+
+def reset():
+    """Sets every counter back to zero."""
+    with _lock:
+        _counters.clear()
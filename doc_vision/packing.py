@@ -0,0 +1,139 @@
+import hashlib
+from . import metrics
+from .cache import cache_disabled
+from .compaction import estimate_tokens
+from .decorators import has_valid_data
+from .json_repair import parse_json_response
+from .process_document import (
+    GPT_MODEL, JSON_MODE, SYSTEM_PROMPT, compact_for_prompt, completion_request, create_completion, get_gpt_cache,
+    gpt_cache_key, gpt_extract_information
+)
+from .replay import recorded_items
+from .schemas import TEXT_PLACEHOLDER, get_schema
+from .tracing import span
+
+# Estimated OCR tokens packed into a single request
+PACK_TOKEN_BUDGET = 3000
+
+# Maximum documents per request, which also bounds the size of the answer
+MAX_PACK_SIZE = 8
+
+
+def plan_packs(documents, token_budget=PACK_TOKEN_BUDGET, max_size=MAX_PACK_SIZE):
+    """
+    Groups documents into packs bounded by an estimated token budget and a document count.
+
+    A document larger than the budget on its own still gets a pack of its own.
+
+    Args:
+        documents (list[tuple[str, str]]): (document ID, text) pairs.
+        token_budget (int): Maximum estimated tokens of text per pack.
+        max_size (int): Maximum documents per pack.
+
+    Returns:
+        list[list[tuple[str, str]]]: The packs, in input order.
+    """
+    packs = []
+    current = []
+    current_tokens = 0
+    for document_id, text in documents:
+        tokens = estimate_tokens(text)
+        if current and (len(current) >= max_size or current_tokens + tokens > token_budget):
+            packs.append(current)
+            current = []
+            current_tokens = 0
+        current.append((document_id, text))
+        current_tokens += tokens
+    if current:
+        packs.append(current)
+    return packs
+
+
+def packed_item_request(schema, text):
+    """
+    Describes one document of a packed request for the record/replay layer.
+
+    Packs are recorded per document, since which documents share a pack
+    depends on pipeline timing; the packed prompt template is hashed so
+    prompt changes are detected.
+    """
+    template = SYSTEM_PROMPT + schema.render_packed_prompt([("DOC1", TEXT_PLACEHOLDER)])
+    return {
+        "model": GPT_MODEL, "packed": schema.name, "json_mode": JSON_MODE,
+        "template": hashlib.sha256(template.encode("utf-8")).hexdigest(), "text": text,
+    }
+
+
+def _ask_packed(schema, pack):
+    """Sends one packed request; returns each document's answer (None when missing)."""
+    content = create_completion(completion_request(schema.render_packed_prompt(pack)))[0]
+    answer = parse_json_response(content)
+    if not isinstance(answer, dict):
+        answer = {}
+    return [answer.get(document_id) for document_id, _ in pack]
+
+
+def gpt_extract_packed(texts, document_type, token_budget=PACK_TOKEN_BUDGET, max_size=MAX_PACK_SIZE):
+    """
+    Extracts structured information from several documents of the same type with packed GPT requests.
+
+    Each pack is sent as a single request whose answer is keyed by document ID.
+    Only the documents whose sub-result is missing or invalid are sent again,
+    one request each. Cached documents are not sent at all.
+
+    Args:
+        texts (dict): Caller key -> visible text, all of the same document type.
+        document_type (str): The type of the documents (e.g., CPF).
+        token_budget (int): Maximum estimated tokens of text per request.
+        max_size (int): Maximum documents per request.
+
+    Returns:
+        dict: Caller key -> extracted information, or the Exception raised for that document.
+    """
+    schema = get_schema(document_type)
+    use_cache = not cache_disabled()
+    cache = get_gpt_cache() if use_cache else None
+    results = {}
+    pending = []  # (document ID, caller key, compacted text)
+
+    for position, (key, text) in enumerate(texts.items(), start=1):
+        compacted = compact_for_prompt(text, document_type)
+        cached = cache.get(gpt_cache_key(compacted, document_type)) if use_cache else None
+        if cached is not None:
+            results[key] = cached
+        else:
+            # Short stable IDs keep the prompt lean and the answer unambiguous
+            pending.append((f"DOC{position}", key, compacted))
+
+    keys = {document_id: key for document_id, key, _ in pending}
+    retry = []
+
+    for pack in plan_packs([(document_id, text) for document_id, _, text in pending], token_budget, max_size):
+        metrics.increment("gpt_requests")
+        metrics.increment("gpt_packed_requests")
+        metrics.increment("gpt_packed_documents", len(pack))
+        requests = [packed_item_request(schema, text) for _, text in pack]
+        try:
+            with span("gpt_extraction", n=1, documents=len(pack)):
+                answers = recorded_items("openai", requests, lambda: _ask_packed(schema, pack))
+        except Exception:
+            answers = [None] * len(pack)
+
+        for (document_id, text), organized_data in zip(pack, answers):
+            # Failed items come back as exceptions, which are not valid data
+            if has_valid_data(organized_data):
+                results[keys[document_id]] = organized_data
+                if use_cache:
+                    cache.set(gpt_cache_key(text, document_type), organized_data)
+            else:
+                retry.append(document_id)
+
+    metrics.increment("gpt_packed_retries", len(retry))
+    for document_id in retry:
+        key = keys[document_id]
+        try:
+            results[key] = gpt_extract_information(texts[key], document_type)
+        except Exception as e:
+            results[key] = e
+
+    return results
@@ -0,0 +1,150 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from .images import PREPROCESS, encode_jpeg, preprocess_for_ocr
+from .process_document import build_result, extract_document_text, organize_document
+from .schemas import get_schema
+from .tracing import span
+
+# Pages rendered at the same time; pdftoppm runs as a subprocess, so threads render in parallel
+RENDER_WORKERS = 4
+
+
+def page_count(pdf_bytes):
+    """Returns the number of pages of a PDF without rendering it."""
+    from pdf2image import pdfinfo_from_bytes  # Deferred: only PDF uploads need it
+
+    return int(pdfinfo_from_bytes(pdf_bytes)["Pages"])
+
+
+def select_pages(pdf_bytes, pages=None, max_pages=None):
+    """
+    Resolves which 1-based page numbers to render.
+
+    Args:
+        pdf_bytes (bytes): The PDF content.
+        pages (Iterable[int] | None): Requested pages. None means the first `max_pages`.
+        max_pages (int | None): Page limit when `pages` is None. None reads every page.
+
+    Returns:
+        list[int]: Existing page numbers, in the requested order.
+    """
+    total = page_count(pdf_bytes)
+    if pages is None:
+        return list(range(1, (min(total, max_pages) if max_pages else total) + 1))
+    return [page for page in pages if 1 <= page <= total]
+
+
+def _render_page(pdf_bytes, page, dpi):
+    from pdf2image import convert_from_bytes  # Deferred: only PDF uploads need it
+
+    # Rendered pages and their resolution are recorded in the trace
+    with span("pdf_render", page=page, dpi=dpi):
+        return convert_from_bytes(pdf_bytes, dpi=dpi, first_page=page, last_page=page)[0]
+
+
+def render_pages(pdf_bytes, pages, dpi=300, workers=RENDER_WORKERS):
+    """
+    Renders the given PDF pages lazily, several at a time.
+
+    Only the requested pages are rasterized, and at most `workers` pages are
+    held in memory ahead of the consumer. Pages are yielded in order as soon
+    as they are ready, so the first page can be processed while the next ones
+    are still rendering.
+
+    Args:
+        pdf_bytes (bytes): The PDF content.
+        pages (list[int]): 1-based page numbers to render.
+        dpi (int): Rendering resolution.
+        workers (int): Pages rendered concurrently.
+
+    Yields:
+        tuple[int, PIL.Image.Image]: Page number and rendered page.
+    """
+    executor = ThreadPoolExecutor(max_workers=max(1, workers))
+    pending = deque()
+    remaining = iter(pages)
+    try:
+        for page in remaining:
+            pending.append((page, executor.submit(_render_page, pdf_bytes, page, dpi)))
+            if len(pending) >= workers:
+                break
+        while pending:
+            page, future = pending.popleft()
+            next_page = next(remaining, None)
+            if next_page is not None:
+                pending.append((next_page, executor.submit(_render_page, pdf_bytes, next_page, dpi)))
+            yield page, future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _ocr_page(image, schema):
+    """Runs OCR on a rendered page, preprocessed and encoded in memory."""
+    if PREPROCESS:
+        return extract_document_text(preprocess_for_ocr(image, schema.ocr_max_side))
+    return extract_document_text(encode_jpeg(image))
+
+
+def extract_pdf_texts(pdf_bytes, document_type, pages=None, workers=RENDER_WORKERS):
+    """
+    Renders and OCRs the pages of a PDF, overlapping rendering with OCR.
+
+    The resolution and default page limit come from the document type's schema.
+
+    Args:
+        pdf_bytes (bytes): The PDF content.
+        document_type (str): The type of the document (e.g., CNH, RG, etc.).
+        pages (Iterable[int] | None): 1-based pages to read. Defaults to the schema's max_pages.
+        workers (int): Pages rendered and OCR'd concurrently.
+
+    Returns:
+        list[tuple[int, str]]: Page number and visible text, in page order.
+    """
+    schema = get_schema(document_type)
+    pages = select_pages(pdf_bytes, pages, schema.max_pages)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [
+            (page, executor.submit(_ocr_page, image, schema))
+            for page, image in render_pages(pdf_bytes, pages, dpi=schema.dpi, workers=workers)
+        ]
+        return [(page, future.result()) for page, future in futures]
+
+
+def merge_page_texts(page_texts):
+    """Joins per-page texts into one text, marking where each page starts."""
+    return "\n".join(f"--- Página {page} ---\n{text}" for page, text in page_texts if text.strip())
+
+
+def process_pdf(pdf_bytes, document_type, pages=None, merge=True, workers=RENDER_WORKERS):
+    """
+    Processes a PDF document, one extraction per page or one for all pages.
+
+    Args:
+        pdf_bytes (bytes): The PDF content.
+        document_type (str): The type of the document (e.g., CNH, RG, etc.).
+        pages (Iterable[int] | None): 1-based pages to read. Defaults to the schema's max_pages.
+        merge (bool): If True, the pages' texts are merged and organized in a single
+            GPT request; otherwise each page gets its own result.
+        workers (int): Pages rendered and OCR'd concurrently.
+
+    Returns:
+        dict | list[dict]: The merged result (with the pages read under "Páginas"),
+        or one result per page (with its number under "Página").
+    """
+    page_texts = extract_pdf_texts(pdf_bytes, document_type, pages, workers)
+    if not page_texts:
+        raise ValueError("O PDF não contém as páginas solicitadas.")
+
+    if merge:
+        text = page_texts[0][1] if len(page_texts) == 1 else merge_page_texts(page_texts)
+        result = organize_document(text, document_type)
+        result["Páginas"] = [page for page, _ in page_texts]
+        return result
+
+    results = []
+    for page, text in page_texts:
+        result = organize_document(text, document_type) if text.strip() else build_result(text, document_type, {})
+        result["Página"] = page
+        results.append(result)
+    return results
@@ -0,0 +1,135 @@
+import logging
+import queue
+import threading
+from .tracing import span
+
+_STOP = object()
+
+
+class Stage:
+    """
+    A single step of a pipeline, executed by its own pool of worker threads.
+
+    Args:
+        name (str): Name used in logs and failure reports.
+        func (Callable): Function applied to each item. Its return value is
+            handed to the next stage.
+        workers (int): Number of worker threads for this stage.
+        batch_size (int): If greater than 1, `func` receives a list of up to
+            `batch_size` items and returns a list with one result per item.
+            A result that is an Exception marks only that item as failed.
+        batch_wait (float): Seconds a worker waits for more items before
+            running an incomplete batch.
+    """
+
+    def __init__(self, name, func, workers=1, batch_size=1, batch_wait=0.05):
+        assert workers >= 1, "A stage needs at least one worker."
+        assert batch_size >= 1, "The batch size must be at least 1."
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+
+
+def run_pipeline(items, stages, queue_size=8):
+    """
+    Runs every item through the given stages concurrently.
+
+    Each stage pulls from its own bounded queue, so a slow stage blocks the
+    stage before it (backpressure) instead of letting work pile up in memory.
+    While stage N works on one item, stage N-1 is already working on the next.
+    Every call of a stage is timed as a "pipeline_<name>" span (see doc_vision.tracing).
+
+    Args:
+        items (Iterable): Input items, consumed lazily.
+        stages (list[Stage]): Stages in execution order.
+        queue_size (int): Maximum number of items waiting in front of each stage.
+
+    Returns:
+        tuple: A list with the outputs of the last stage and a list of
+        ``(item, stage_name, exception)`` tuples for the items that failed.
+    """
+    assert stages, "A pipeline needs at least one stage."
+
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    outputs = []
+    failures = []
+    lock = threading.Lock()
+    remaining_workers = [stage.workers for stage in stages]
+
+    def worker(index):
+        stage = stages[index]
+        inbox = queues[index]
+        outbox = queues[index + 1] if index + 1 < len(stages) else None
+
+        def emit(item, result):
+            if isinstance(result, Exception):
+                logging.error(f"❌ Stage '{stage.name}' failed: {result}")
+                with lock:
+                    failures.append((item, stage.name, result))
+            elif outbox is not None:
+                outbox.put(result)
+            else:
+                with lock:
+                    outputs.append(result)
+
+        stopped = False
+        while not stopped:
+            item = inbox.get()
+            if item is _STOP:
+                break
+
+            if stage.batch_size == 1:
+                try:
+                    with span(f"pipeline_{stage.name}"):
+                        result = stage.func(item)
+                except Exception as e:
+                    result = e
+                emit(item, result)
+                continue
+
+            batch = [item]
+            while len(batch) < stage.batch_size:
+                try:
+                    item = inbox.get(timeout=stage.batch_wait)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopped = True
+                    break
+                batch.append(item)
+
+            try:
+                with span(f"pipeline_{stage.name}", items=len(batch)):
+                    results = stage.func(batch)
+            except Exception as e:
+                results = [e] * len(batch)
+            for item, result in zip(batch, results):
+                emit(item, result)
+
+        # The last worker leaving a stage tells the next stage to shut down
+        with lock:
+            remaining_workers[index] -= 1
+            last_worker = remaining_workers[index] == 0
+        if last_worker and outbox is not None:
+            for _ in range(stages[index + 1].workers):
+                outbox.put(_STOP)
+
+    threads = [
+        threading.Thread(target=worker, args=(index,), name=f"{stage.name}-{n}", daemon=True)
+        for index, stage in enumerate(stages)
+        for n in range(stage.workers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    for item in items:
+        queues[0].put(item)
+    for _ in range(stages[0].workers):
+        queues[0].put(_STOP)
+
+    for thread in threads:
+        thread.join()
+
+    return outputs, failures
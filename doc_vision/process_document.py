@@ -1,325 +1,341 @@
-from openai import OpenAI
-from .google_vision import google_vision_extract
+from .google_vision import google_vision_extract, google_vision_batch_extract, read_image
 from .utils import list_visible_information
-from .decorators import vote, has_valid_data  
+from .decorators import vote_candidates, has_valid_data  
+from .clients import get_openai_client
+from . import metrics
 import json
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from types import SimpleNamespace
+from .cache import cache_disabled, get_cache, make_key
+from .schemas import TEXT_PLACEHOLDER, get_schema
+from .json_repair import parse_json_response
+from .compaction import compact_text, estimate_tokens
+from .images import PREPROCESS, preprocess_for_ocr
+from .ratelimit import get_limiter
+from .replay import recorded
+from .tracing import log_payload, span
+
+GPT_MODEL = "gpt-3.5-turbo"
+SYSTEM_PROMPT = "You are an AI assistant that organizes document information."
+
+# Bump when the way responses are interpreted changes; prompt text changes are detected automatically
+PROMPT_VERSION = 2
+
+# Completion tokens reserved per candidate against the tokens-per-minute quota
+COMPLETION_TOKENS = 400
+
+# Constrains GPT to answer with a JSON object (OpenAI JSON mode)
+JSON_MODE = os.environ.get("DOC_VISION_JSON_MODE", "1").lower() not in ("0", "false", "no")
+
+def build_prompt(extracted_text, document_type):
+    """Builds the extraction prompt for the given document type from its schema."""
+    return get_schema(document_type).render_prompt(extracted_text)
+
+
+def compact_for_prompt(extracted_text, document_type):
+    """
+    Removes boilerplate, duplicates and noise from the OCR text before it goes into a prompt.
 
-# Load the API key from the JSON configuration file
-with open("config.json", "r") as config_file:
-    config = json.load(config_file)
+    The document's token counts before and after are stored as attributes of its
+    "prompt_compaction" span (see doc_vision.tracing) and added to the
+    "prompt_tokens_before", "prompt_tokens_after" and "prompt_tokens_saved" counters.
+    """
+    with span("prompt_compaction", document_type=document_type) as compaction:
+        compacted, report = compact_text(extracted_text, get_schema(document_type).drop_patterns)
+        compaction.attributes.update(
+            tokens_before=report["tokens_before"], tokens_after=report["tokens_after"],
+            tokens_saved=report["tokens_saved"],
+        )
+    return compacted
 
-api_key = config["openai_api_key"]
 
-# Configure the OpenAI API
-client = OpenAI(api_key=api_key)
+def get_gpt_cache():
+    """Returns the on-disk GPT response cache (128 MB, entries expire after 30 days)."""
+    return get_cache("gpt", max_bytes=128 * 1024 * 1024, ttl=30 * 24 * 3600)
 
-import json
-from openai import OpenAI
-
-def gpt_extract_information(extracted_text, document_type):
-    """Uses GPT to extract structured information from the given text."""
-    
-    prompts = {
-        "Certidão de Casamento": f"""
-        Extraia as seguintes informações de uma Certidão de Casamento com base no texto abaixo:
-        - Nome dos noivos
-        - Data do casamento
-        - Regime de bens
-        - Nome alterado (se algum dos noivos mudou de nome após o casamento)
-        - Estado civil antes do casamento (solteiro, divorciado, etc.)
-
-        Texto da certidão:
-        {extracted_text}
-
-        Responda em JSON com o formato:
-        {{
-            "Nome dos Noivos": ["Noivo", "Noiva"],
-            "Data do Casamento": "",
-            "Regime de Bens": "",
-            "Nome Alterado": ["Nome anterior -> Nome atual"],
-            "Estado Civil Antes do Casamento": ["Estado civil do Noivo", "Estado civil da Noiva"]
-        }}
-        """,
-
-        "Certidão de Nascimento": f"""
-        Extraia as seguintes informações de uma Certidão de Nascimento com base no texto abaixo:
-        - Nome do titular do documento
-        - Data de nascimento
-        - Naturalidade
-        - Filiação (nome do pai e da mãe, se disponíveis)
-
-        Texto da certidão:
-        {extracted_text}
-
-        Responda em JSON com o formato:
-        {{
-            "Nome": "",
-            "Data de Nascimento": "",
-            "Naturalidade": "",
-            "Filiação": ["Nome do Pai", "Nome da Mãe"]
-        }}
-        """,
-
-        "CNH": f"""
-        Extraia as seguintes informações de uma CNH (Carteira Nacional de Habilitação) com base no texto abaixo:
-        - Nome completo
-        - RG
-        - CPF
-        - Filiação (pai e mãe)
-        - Data de validade da CNH
-        - Local de emissão
-
-        Texto da CNH:
-        {extracted_text}
-
-        Responda em JSON com o formato:
-        {{
-            "Nome": "",
-            "RG": "",
-            "CPF": "",
-            "Filiação": ["Nome do Pai", "Nome da Mãe"],
-            "Validade": "",
-            "Local de Emissão": ""
-        }}
-        """,
-
-        "RG": f"""
-        Extraia as seguintes informações de um RG (Registro Geral) com base no texto abaixo:
-        - Nome completo
-        - RG
-        - CPF (se disponível)
-        - Data de nascimento
-        - Naturalidade
-        - Filiação (pai e mãe)
-
-        Texto do RG:
-        {extracted_text}
-
-        Responda em JSON com o formato:
-        {{
-            "Nome": "",
-            "RG": "",
-            "CPF": "",
-            "Data de Nascimento": "",
-            "Naturalidade": "",
-            "Filiação": ["Nome do Pai", "Nome da Mãe"]
-        }}
-        """,
-
-        "CPF": f"""
-        Extraia as seguintes informações de um CPF com base no texto abaixo:
-        - Nome completo
-        - CPF
-        - Data de nascimento
-
-        Texto do CPF:
-        {extracted_text}
-
-        Responda em JSON com o formato:
-        {{
-            "Nome": "",
-            "CPF": "",
-            "Data de Nascimento": ""
-        }}
-        """,
-
-        "Comprovante de Endereço": f"""
-        Extraia as seguintes informações de um comprovante de endereço com base no texto abaixo:
-        - Nome do titular do comprovante
-        - Endereço completo (incluindo rua, número, bairro, cidade, estado e CEP)
-
-        Texto do comprovante de endereço:
-        {extracted_text}
-
-        Responda em JSON com o formato:
-        {{
-            "Nome Completo": "",
-            "Endereço Completo": ""
-        }}
-        """,
-
-        "CTPS": f"""
-        Extraia as seguintes informações de uma CTPS (Carteira de Trabalho e Previdência Social) com base no texto abaixo:
-        - Nome completo do titular
-        - Ocupação atual (cargo ou função descrito no documento)
-        - Remunerações (valores salariais mencionados, incluindo períodos de pagamento)
-
-        Texto da CTPS:
-        {extracted_text}
-
-        Responda em JSON com o formato:
-        {{
-            "Nome": "",
-            "Ocupação": "",
-            "Remunerações": [
-                {{
-                    "Período": "",
-                    "Valor": ""
-                }}
-            ]
-        }}
-        """,
-
-        "Holerite": f"""
-        Extraia as seguintes informações de um holerite com base no texto abaixo:
-        - Nome do funcionário
-        - Salário base
-        - Descontos
-        - Valor líquido
-
-        Texto do holerite:
-        {extracted_text}
-
-        Responda em JSON com o formato:
-        {{
-            "Nome": "",
-            "Salário Base": "",
-            "Descontos": "",
-            "Valor Líquido": ""
-        }}
-        """,
-
-        "Imposto de Renda": f"""
-        Extraia as seguintes informações de um documento de Imposto de Renda com base no texto abaixo:
-        - Nome do declarante
-        - CPF do declarante
-        - Natureza do rendimento
-        - Valor dos rendimentos
-
-        Texto do documento:
-        {extracted_text}
-
-        Responda em JSON com o formato:
-        {{
-            "Nome": "",
-            "CPF": "",
-            "Natureza do Rendimento": "",
-            "Valor dos Rendimentos": ""
-        }}
-        """,
-
-        "Driver's License": f"""
-        Extraia as seguintes informações de um documento de Driver's License com base no texto abaixo:
-        - Nome
-        - Número da CNH
-        - Data de Nascimento
-        - Endereço
-        - Classe
-        - Data de Expiração
-        - Data de Emissão
-        - Altura
-        - Sexo
-        - Cor dos Olhos
-
-        Texto do documento:
-        {extracted_text}
-
-        Responda em JSON com o formato:
-        {{
-            "Nome": "",
-            "Número da CNH": "",
-            "Data de Nascimento": "",
-            "Endereço": "",
-            "Classe": "",
-            "Data de Expiração": "",
-            "Data de Emissão": "",
-            "Altura": "",
-            "Sexo": "",
-            "Cor dos Olhos": ""
-        }}
-        """,
-
-        "FGTS": f"""
-        Extraia as seguintes informações de um extrato do FGTS com base no texto abaixo:
-        - Nome do trabalhador
-        - Nome das empresas onde o trabalhador teve vínculo
-        - Valores depositados por cada empresa
-
-        Texto do extrato do FGTS:
-        {extracted_text}
-
-        Responda em JSON com o formato:
-        {{
-            "Nome": "",
-            "Empresas": [
-                {{
-                    "Empresa": "",
-                    "Valor Depositado": ""
-                }}
-            ]
-        }}
-        """
-    }
 
-    prompt = prompts.get(document_type, f"""
-    Extraia as seguintes informações de um documento do tipo {document_type} com base no texto abaixo:
-    - Nome
-    - CPF
-    - RG
-    - Data de Nascimento
-    - Data de Expedição
-    - Naturalidade
-    - Filiação (pai e mãe)
-
-    Texto do documento:
-    {extracted_text}
-
-    Responda em JSON com o formato:
-    {{
-        "Nome": "",
-        "CPF": "",
-        "RG": "",
-        "Data de Nascimento": "",
-        "Data de Expedição": "",
-        "Naturalidade": "",
-        "Filiação": ["Nome do Pai", "Nome da Mãe"]
-    }}
-    """)
-
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "You are an AI assistant that organizes document information."},
-            {"role": "user", "content": prompt}
-        ]
+def gpt_cache_key(extracted_text, document_type, model=GPT_MODEL):
+    """
+    Builds the GPT cache key from the normalized text, document type, model and prompt version.
+
+    The prompt template is rendered with a placeholder and hashed, so any prompt
+    change invalidates the cached responses automatically.
+    """
+    normalized_text = "\n".join(" ".join(line.split()) for line in extracted_text.splitlines() if line.strip())
+    template = build_prompt(TEXT_PLACEHOLDER, document_type)
+    template_hash = hashlib.sha256((SYSTEM_PROMPT + template).encode("utf-8")).hexdigest()
+    return make_key(normalized_text, document_type, model, PROMPT_VERSION, template_hash)
+
+
+def completion_request(prompt, n=1):
+    """Builds the chat completion arguments for an extraction prompt with `n` candidates."""
+    options = {"response_format": {"type": "json_object"}} if JSON_MODE else {}
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+    return {"model": GPT_MODEL, "messages": messages, "n": n, **options}
+
+
+def create_completion(request):
+    """
+    Calls GPT through the shared OpenAI rate limiter, which retries throttled
+    requests, bypassing the record/replay layer.
+
+    Returns:
+        list[str]: The content of each completion.
+    """
+    prompt = request["messages"][-1]["content"]
+    response = get_limiter("openai").call(
+        get_openai_client().chat.completions.create,
+        tokens=estimate_tokens(SYSTEM_PROMPT + prompt) + request["n"] * COMPLETION_TOKENS,
+        **request
     )
+    return [choice.message.content for choice in response.choices]
+
+
+def chat_completion(prompt, n=1):
+    """
+    Sends an extraction prompt to GPT, asking for `n` candidate completions.
+
+    The call goes through the shared OpenAI rate limiter and the record/replay layer.
+
+    Returns:
+        A response whose `choices[i].message.content` holds each completion.
+    """
+    metrics.increment("gpt_requests")
+    request = completion_request(prompt, n)
+    with span("gpt_extraction", n=n):
+        contents = recorded("openai", request, lambda: create_completion(request))
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=c)) for c in contents])
 
-    return json.loads(response.choices[0].message.content)
+
+def gpt_extract_information(extracted_text, document_type, use_cache=True):
+    """
+    Uses GPT to extract structured information from the given text.
+
+    Args:
+        extracted_text (str): Visible text of the document.
+        document_type (str): The type of the document (e.g., CNH, RG, etc.).
+        use_cache (bool): If False, always requests a fresh completion (e.g. for voting).
+
+    Returns:
+        dict: The extracted information.
+    """
+    extracted_text = compact_for_prompt(extracted_text, document_type)
+
+    use_cache = use_cache and not cache_disabled()
+    if use_cache:
+        cache = get_gpt_cache()
+        key = gpt_cache_key(extracted_text, document_type)
+        cached = cache.get(key)
+        if cached is not None:
+            metrics.increment("gpt_cache_hits")
+            return cached
+
+    response = chat_completion(build_prompt(extracted_text, document_type))
+
+    organized_data = parse_json_response(response.choices[0].message.content)
+
+    # Invalid answers are not cached, so the next run asks GPT again
+    if use_cache and has_valid_data(organized_data):
+        cache.set(key, organized_data)
+    return organized_data
+
+
+def gpt_extract_candidates(extracted_text, document_type, n=5):
+    """
+    Asks GPT for `n` candidate extractions in a single request.
+
+    The prompt is sent (and billed) once instead of once per candidate.
+    Candidates that cannot be parsed nor repaired as JSON are skipped.
+
+    Returns:
+        list[dict]: The parsed candidates.
+    """
+    extracted_text = compact_for_prompt(extracted_text, document_type)
+    response = chat_completion(build_prompt(extracted_text, document_type), n=n)
+
+    candidates = []
+    for choice in response.choices:
+        try:
+            candidates.append(parse_json_response(choice.message.content))
+        except ValueError:
+            continue
+    return candidates
+
+
+def gpt_extract_with_vote(extracted_text, document_type, n=5, threshold=0.3):
+    """
+    Extracts information by voting over `n` candidates from a single GPT request.
+    """
+    with span("vote", n=n):
+        return vote_candidates(gpt_extract_candidates(extracted_text, document_type, n=n), threshold)
 
 
-def extract_text(image_path):
-    """Extracts visible text from an image using Google Vision."""
-    extracted_text = google_vision_extract(image_path)
-    print(f"🔍 Extracted text: {extracted_text}")  # DEBUG: Verifique se algo está sendo extraído
+def extract_text(image, use_cache=True, content_hash=None):
+    """Extracts visible text from an image (file path, bytes or file-like) using Google Vision."""
+    extracted_text = google_vision_extract(image, use_cache=use_cache, content_hash=content_hash)
     return "\n".join(list_visible_information(extracted_text))
 
 
-def process_document(image_path, document_type):
+def prepare_image(image, document_type):
+    """
+    Preprocesses an image for OCR with the settings of its document type.
+
+    Returns the image unchanged when preprocessing is disabled, no document type
+    is given or the image cannot be decoded (Vision then reports the error).
+    """
+    if not PREPROCESS or document_type is None:
+        return image
+    try:
+        return preprocess_for_ocr(read_image(image), get_schema(document_type).ocr_max_side)
+    except OSError as e:
+        print(f"⚠️ DEBUG: Pré-processamento ignorado: {e}")
+        return image
+
+
+# OCR results kept per input, so retries and voting never re-run OCR on an unchanged image
+OCR_MEMO_SIZE = 1024
+_ocr_memo = OrderedDict()
+_ocr_memo_lock = threading.Lock()
+
+
+def _is_path(image):
+    return isinstance(image, (str, os.PathLike))
+
+
+def _input_key(image, content_hash=None):
+    """Identifies a file by its path, modification time and size, and in-memory bytes by their content."""
+    if not _is_path(image):
+        return ("bytes", content_hash or hashlib.sha256(image).hexdigest())
+    stat = os.stat(image)
+    return (os.path.abspath(image), stat.st_mtime_ns, stat.st_size)
+
+
+def _remember_text(key, extracted_text):
+    with _ocr_memo_lock:
+        _ocr_memo[key] = extracted_text
+        _ocr_memo.move_to_end(key)
+        while len(_ocr_memo) > OCR_MEMO_SIZE:
+            _ocr_memo.popitem(last=False)
+
+
+def _recall_text(key):
+    with _ocr_memo_lock:
+        extracted_text = _ocr_memo.get(key)
+        if extracted_text is not None:
+            _ocr_memo.move_to_end(key)
+    if extracted_text is not None:
+        metrics.increment("ocr_memo_hits")
+    return extracted_text
+
+
+def extract_texts(images, document_types=None):
+    """
+    Extracts visible text from many images using batched Google Vision requests.
+
+    Images are file paths or encoded images (bytes, memoryview or file-like).
+    With `document_types` (one per image), each image is preprocessed for its type first.
+    Returns, for each image, the visible text or the Exception raised for it.
+    """
+    images = [image if _is_path(image) else read_image(image) for image in images]
+    ocr_images = [
+        prepare_image(image, document_type)
+        for image, document_type in zip(images, document_types or [None] * len(images))
+    ]
+    results = []
+    for image, text in zip(images, google_vision_batch_extract(ocr_images)):
+        if not isinstance(text, Exception):
+            text = "\n".join(list_visible_information(text))
+            if text.strip():
+                _remember_text(_input_key(image), text)
+        results.append(text)
+    return results
+
+
+def extract_document_text(image, document_type=None, content_hash=None):
+    """
+    OCR stage: extracts the visible text of a document image.
+
+    The image is a file path or the encoded image itself (bytes, memoryview or
+    file-like). With a document type, it is preprocessed for OCR first (see
+    prepare_image); either way it is never written to disk.
+    The result is kept per input, so a later call for the same unchanged image
+    (retries, voting over process_document) does not call Google Vision again.
+    An empty extraction is retried once without the OCR cache; voting over OCR
+    is pointless since Vision returns the same text for the same image.
+    Pass the SHA-256 of in-memory bytes as `content_hash` when it is already
+    known (e.g. from download_document) to skip hashing them again.
+    """
+    if not _is_path(image):
+        image = read_image(image)
+    key = _input_key(image, content_hash)
+    extracted_text = _recall_text(key)
+    if extracted_text is not None:
+        return extracted_text
+
+    ocr_image = prepare_image(image, document_type)
+    # The known hash only identifies the bytes as they were given, not a preprocessed copy
+    ocr_hash = content_hash if ocr_image is image else None
+    extracted_text = extract_text(ocr_image, content_hash=ocr_hash)
+    log_payload("📝 DEBUG: Texto extraído:", extracted_text)
+
+    if not extracted_text.strip():
+        print("⚠️ DEBUG: Texto extraído está vazio. Tentando novamente sem cache.")
+        extracted_text = extract_text(ocr_image, use_cache=False)
+
+    _remember_text(key, extracted_text)
+    return extracted_text
+
+
+def organize_document(extracted_text, document_type, use_cache=True, samples=1):
+    """
+    Extraction stage: organizes already extracted text into the final result.
+
+    Pass use_cache=False to request a fresh GPT answer instead of a cached one,
+    or samples > 1 to vote over that many candidates from a single GPT request.
+    """
+    # Process the extracted text with GPT
+    if samples > 1:
+        organized_data = gpt_extract_with_vote(extracted_text, document_type, n=samples)
+    else:
+        organized_data = gpt_extract_information(extracted_text, document_type, use_cache=use_cache)
+
+    return build_result(extracted_text, document_type, organized_data)
+
+
+def build_result(extracted_text, document_type, organized_data):
+    """
+    Normalizes the organized data with the document schema and prepares the final JSON.
+    """
+    organized_data = get_schema(document_type).normalize(organized_data)
+
+    # Prepare final JSON
+    final_result = {
+        "Tipo de Documento": document_type,
+        "Texto Visível": extracted_text,
+        "Informações Organizadas": organized_data
+    }
+
+    log_payload("✅ DEBUG: JSON final retornado:\n", lambda: json.dumps(final_result, indent=4, ensure_ascii=False))
+    return final_result
+
+
+def process_document(image, document_type, use_cache=True, content_hash=None):
     """
     Processes a document image to extract structured information.
+
+    The image is a file path or the encoded image itself (bytes, memoryview or file-like),
+    optionally with the SHA-256 of its bytes as `content_hash`.
+    Pass use_cache=False to re-sample the GPT extraction (e.g. when voting).
     """
     try:
-        # Extract visible text
-        extracted_text = extract_text(image_path)
-        print(f"📝 DEBUG: Texto extraído: {extracted_text}")
-
-        # Apply voting mechanism if needed
-        if not extracted_text.strip():
-            print("⚠️ DEBUG: Texto extraído está vazio. Aplicando mecanismo de votação.")
-            extracted_text = vote(5)(extract_text)(image_path)
-
-        # Process the extracted text with GPT
-        organized_data = gpt_extract_information(extracted_text, document_type)
-
-        # Prepare final JSON
-        final_result = {
-            "Tipo de Documento": document_type,
-            "Texto Visível": extracted_text,
-            "Informações Organizadas": organized_data
-        }
-
-        print(f"✅ DEBUG: JSON final retornado:\n{json.dumps(final_result, indent=4, ensure_ascii=False)}")
-        return final_result
+        extracted_text = extract_document_text(image, document_type, content_hash)
+        return organize_document(extracted_text, document_type, use_cache=use_cache)
 
     except Exception as e:
         print(f"❌ DEBUG: Erro no process_document: {e}")
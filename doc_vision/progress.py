@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+# States of an input in the progress manifest
+STARTED = "started"
+DONE = "done"
+FAILED = "failed"
+
+# Journal lines written between two fsyncs; every line is flushed, so only an OS crash can lose them
+SYNC_EVERY = 32
+
+
+def file_sha256(path):
+    """Returns the SHA-256 of a file's content, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_shard(value):
+    """
+    Parses a shard given as "i/N" (0-based index out of N shards).
+
+    Returns:
+        tuple[int, int]: Index and count.
+
+    Raises:
+        ValueError: If the value is malformed or the index is out of range.
+    """
+    index, _, count = value.partition("/")
+    index, count = int(index), int(count)
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard {value!r}: expected i/N with 0 <= i < N.")
+    return index, count
+
+
+def in_shard(name, index, count):
+    """
+    Returns True if an input belongs to shard `index` of `count`.
+
+    The shard is chosen from the SHA-256 of the input's path relative to its
+    input directory, so every node assigns the same inputs to the same shard
+    without reading them, whatever the dataset's mount point.
+    """
+    if count == 1:
+        return True
+    return int(hashlib.sha256(name.encode("utf-8")).hexdigest()[:16], 16) % count == index
+
+
+class ProgressManifest:
+    """
+    Crash-safe record of which inputs a batch run has completed, keyed by input content hash.
+
+    Every state change is appended to a JSON-lines journal and flushed at once,
+    so a run killed at any point leaves a readable manifest; a torn last line is
+    cut off on load, so the next event starts on a line of its own. Reloading
+    folds the journal into the latest state per input. Inputs whose path,
+    modification time and size match the journal reuse the recorded hash, so
+    a restart does not read every input again.
+
+    Args:
+        path (str): Journal file, created if missing.
+        sync_every (int): Lines appended between two fsyncs.
+    """
+
+    def __init__(self, path, sync_every=SYNC_EVERY):
+        self.path = path
+        self.sync_every = sync_every
+        self.entries = {}
+        self._hashes = {}
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        if os.path.exists(path):
+            self._load(path)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _load(self, path):
+        complete = 0  # Bytes up to the end of the last complete line
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Torn line from an interrupted write
+                complete += len(line)
+                try:
+                    self._apply(json.loads(line))
+                except ValueError:
+                    continue
+        if complete < os.path.getsize(path):
+            os.truncate(path, complete)
+
+    def _apply(self, event):
+        key = event["key"]
+        entry = self.entries.setdefault(key, {"state": STARTED, "attempts": 0})
+        entry.update({field: value for field, value in event.items() if field != "key"})
+        if "path" in event and "stat" in event:
+            self._hashes[event["path"]] = (event["stat"], key)
+
+    def _append(self, event):
+        with self._lock:
+            self._apply(event)
+            self._file.write(json.dumps(event, ensure_ascii=False) + "\n")
+            self._file.flush()
+            self._unsynced += 1
+            if self._unsynced >= self.sync_every:
+                os.fsync(self._file.fileno())
+                self._unsynced = 0
+
+    def content_hash(self, path):
+        """Returns the SHA-256 of an input, reusing the recorded one when its stat is unchanged."""
+        stat = os.stat(path)
+        state = [stat.st_mtime_ns, stat.st_size]
+        with self._lock:
+            known = self._hashes.get(os.path.abspath(path))
+        if known is not None and known[0] == state:
+            return known[1]
+        return file_sha256(path)
+
+    def should_process(self, key, max_attempts):
+        """Returns True unless the input is done or has already failed `max_attempts` times."""
+        with self._lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            return True
+        return entry["state"] != DONE and entry["attempts"] < max_attempts
+
+    def start(self, key, path):
+        """Records a new attempt at an input."""
+        stat = os.stat(path)
+        with self._lock:
+            attempts = self.entries.get(key, {}).get("attempts", 0) + 1
+        self._append({
+            "key": key, "state": STARTED, "attempts": attempts, "path": os.path.abspath(path),
+            "stat": [stat.st_mtime_ns, stat.st_size], "time": time.time(),
+        })
+
+    def done(self, key, output=None):
+        """Records that an input was processed, with where its result went."""
+        self._append({"key": key, "state": DONE, "output": output, "error": None, "time": time.time()})
+
+    def failed(self, key, error):
+        """Records that the current attempt at an input failed."""
+        self._append({"key": key, "state": FAILED, "error": str(error), "time": time.time()})
+
+    def counts(self):
+        """Returns the number of inputs in each state."""
+        with self._lock:
+            counts = {STARTED: 0, DONE: 0, FAILED: 0}
+            for entry in self.entries.values():
+                counts[entry["state"]] += 1
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+
+def merge_manifests(paths, output):
+    """
+    Merges the manifests of several shards (or runs) into one compacted journal.
+
+    An input done in any manifest is done; otherwise it keeps the state of its
+    latest event, and attempts are added up across manifests.
+
+    Args:
+        paths (list[str]): Manifests to merge.
+        output (str): Merged manifest, written atomically (it may be one of `paths`).
+
+    Returns:
+        dict: Number of inputs in each state.
+    """
+    merged = {}
+    for path in paths:
+        manifest = ProgressManifest(path)
+        manifest.close()
+        for key, entry in manifest.entries.items():
+            current = merged.get(key)
+            if current is None:
+                merged[key] = dict(entry)
+                continue
+            attempts = current["attempts"] + entry["attempts"]
+            if current["state"] != DONE and (entry["state"] == DONE or entry.get("time", 0) > current.get("time", 0)):
+                current = merged[key] = dict(entry)
+            current["attempts"] = attempts
+
+    directory = os.path.dirname(output) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=".jsonl")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for key, entry in sorted(merged.items()):
+                f.write(json.dumps({"key": key, **entry}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, output)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    counts = {STARTED: 0, DONE: 0, FAILED: 0}
+    for entry in merged.values():
+        counts[entry["state"]] += 1
+    return counts
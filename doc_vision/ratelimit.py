@@ -0,0 +1,289 @@
+import os
+import random
+import threading
+import time
+from . import metrics
+
+# Quotas per provider; override with DOC_VISION_<PROVIDER>_RPM / _TPM / _CONCURRENCY
+DEFAULT_LIMITS = {
+    "vision": {"rpm": 1800, "tpm": None, "concurrency": 16},
+    "language": {"rpm": 600, "tpm": None, "concurrency": 8},
+    "openai": {"rpm": 3500, "tpm": 90000, "concurrency": 16},
+}
+
+# Retries of a throttled or failed call before the error is raised
+MAX_RETRIES = 5
+
+# Exponential backoff bounds, in seconds
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+
+_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+# SDK network errors and timeouts, which carry no HTTP status, by top-level package and
+# class name (subclasses included), so the SDKs are not imported here
+_RETRYABLE_ERRORS = {
+    "openai": {"APIConnectionError", "APITimeoutError"},
+    "google": {"DeadlineExceeded", "ServiceUnavailable"},
+}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at a per-minute rate.
+
+    Args:
+        per_minute (float): Tokens added per minute; also the bucket capacity.
+    """
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        """
+        Blocks until `amount` tokens are available and takes them.
+
+        A request larger than the capacity waits for a full bucket and drives it negative,
+        so it is delayed instead of rejected.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                needed = min(amount, self.capacity)
+                if self.tokens >= needed:
+                    self.tokens -= amount
+                    return
+                wait = (needed - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveConcurrency:
+    """
+    Concurrency limit adjusted with AIMD: it grows by one slot per window of
+    successful calls and is halved when the provider throttles.
+
+    Throttles from calls started before the last decrease are ignored, so a
+    burst of concurrent 429s halves the limit once instead of collapsing it.
+
+    Args:
+        maximum (int): Upper bound of the limit.
+        minimum (int): Lower bound of the limit.
+        initial (int | None): Starting limit. Defaults to half the maximum.
+    """
+
+    def __init__(self, maximum, minimum=1, initial=None):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(initial or max(minimum, maximum // 2))
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Blocks until a slot is free and returns the call's start time."""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+            return time.monotonic()
+
+    def release(self, started, throttled=False):
+        """
+        Frees a slot and adjusts the limit with the outcome of the call.
+
+        Args:
+            started (float): Start time returned by acquire().
+            throttled (bool): True if the provider rejected the call for load.
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                if started >= self.last_decrease:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self.last_decrease = time.monotonic()
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+def _status_code(error):
+    """Returns the HTTP status of an OpenAI or Google API error, if any."""
+    for attribute in ("status_code", "code"):
+        status = getattr(error, attribute, None)
+        if isinstance(status, int):
+            return status
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _retry_after(error):
+    """Returns the delay requested by the provider in seconds, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for header in ("retry-after-ms", "retry-after"):
+        value = headers.get(header)
+        if value is None:
+            continue
+        try:
+            seconds = float(value)
+        except ValueError:
+            continue
+        return seconds / 1000 if header == "retry-after-ms" else seconds
+    return None
+
+
+def is_retryable(error):
+    """Returns True for throttling (429), connection errors, timeouts and transient server errors (5xx)."""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    for cls in type(error).__mro__:
+        if cls.__name__ in _RETRYABLE_ERRORS.get(cls.__module__.partition(".")[0], ()):
+            return True
+    return _status_code(error) in _RETRYABLE_STATUS
+
+
+class RateLimiter:
+    """
+    Shared limiter for one external API: request and token buckets, an
+    adaptive concurrency limit and retries with jittered backoff.
+
+    Args:
+        name (str): Provider name used in metrics (e.g. "openai").
+        rpm (int | None): Requests per minute; None disables the request quota.
+        tpm (int | None): Tokens per minute; None if the provider has no token quota.
+        concurrency (int): Maximum calls in flight.
+        max_retries (int): Retries of a retryable error before it is raised.
+    """
+
+    def __init__(self, name, rpm, tpm=None, concurrency=16, max_retries=MAX_RETRIES):
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.concurrency = AdaptiveConcurrency(concurrency)
+        self.max_retries = max_retries
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _wait_pause(self):
+        """Waits while every caller is paused by a Retry-After from the provider."""
+        while True:
+            with self._lock:
+                wait = self.paused_until - time.monotonic()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def _pause(self, seconds):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def _backoff(self, attempt, error):
+        """Returns the delay before the next attempt: Retry-After if given, else full-jitter exponential."""
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            self._pause(retry_after)
+            return retry_after
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    def call(self, func, *args, cost=1, tokens=0, **kwargs):
+        """
+        Calls `func(*args, **kwargs)` within the provider's quotas, retrying retryable errors.
+
+        Args:
+            func (Callable): The API call.
+            cost (int): Requests counted against the per-minute quota (e.g. images in a batch).
+            tokens (int): Estimated tokens counted against the token quota.
+
+        Returns:
+            The return value of `func`.
+
+        Raises:
+            Exception: The last error, once it is not retryable or retries are exhausted.
+        """
+        for attempt in range(self.max_retries + 1):
+            self._wait_pause()
+            if self.requests is not None:
+                self.requests.acquire(cost)
+            if self.tokens is not None and tokens:
+                self.tokens.acquire(tokens)
+
+            started = self.concurrency.acquire()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                throttled = is_retryable(e)
+                self.concurrency.release(started, throttled=throttled)
+                if not throttled or attempt == self.max_retries:
+                    raise
+                metrics.increment(f"{self.name}_throttled")
+                time.sleep(self._backoff(attempt, e))
+                continue
+
+            self.concurrency.release(started)
+            return result
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _env_limit(provider, setting, default):
+    """
+    Reads a limit override from DOC_VISION_<PROVIDER>_<SETTING>.
+
+    A quota (rpm, tpm) of 0 disables it; the concurrency must be at least 1.
+
+    Raises:
+        ValueError: If the value is not an integer or is out of range.
+    """
+    name = f"DOC_VISION_{provider.upper()}_{setting.upper()}"
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    limit = int(value)
+    if limit < (1 if setting == "concurrency" else 0):
+        minimum = "at least 1" if setting == "concurrency" else "0 (no quota) or more"
+        raise ValueError(f"{name} must be {minimum}, got {value!r}.")
+    return limit or None
+
+
+def get_limiter(provider):
+    """
+    Returns the process-wide limiter for a provider, creating it on first use.
+
+    Args:
+        provider (str): One of "vision", "language" or "openai".
+
+    Returns:
+        RateLimiter: The shared limiter.
+    """
+    limiter = _limiters.get(provider)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(provider)
+            if limiter is None:
+                limits = DEFAULT_LIMITS[provider]
+                limiter = RateLimiter(
+                    provider,
+                    rpm=_env_limit(provider, "rpm", limits["rpm"]),
+                    tpm=_env_limit(provider, "tpm", limits["tpm"]),
+                    concurrency=_env_limit(provider, "concurrency", limits["concurrency"]),
+                )
+                _limiters[provider] = limiter
+    return limiter
+
+
+def reset_limiters():
+    """Drops every limiter so the next call creates new ones (e.g. after changing the limits)."""
+    with _limiters_lock:
+        _limiters.clear()
@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+# "record" stores every external API call in the cassette, "replay" serves them from it
+MODE = os.environ.get("DOC_VISION_REPLAY_MODE", "off").lower()
+CASSETTE_PATH = os.environ.get("DOC_VISION_CASSETTE", os.path.join(".cassettes", "doc_vision.jsonl"))
+
+# "recorded" replays each call with the latency it had when recorded, "instant" without waiting
+REPLAY_LATENCY = os.environ.get("DOC_VISION_REPLAY_LATENCY", "recorded").lower()
+
+_MODES = ("off", "record", "replay")
+
+
+class ReplayedError(Exception):
+    """An API error served from a cassette, with the HTTP status it was recorded with."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class Cassette:
+    """
+    Append-only JSON-lines file of API calls: request fingerprint, response or error, and latency.
+
+    Identical requests (e.g. the samples of a vote) are served in the order they were recorded;
+    once they run out, the last one is served again.
+
+    Args:
+        path (str): Cassette file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = defaultdict(deque)
+        self._last = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["fingerprint"]].append(entry)
+
+    def append(self, entry):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def next(self, fingerprint):
+        """Returns the next recorded entry for a fingerprint, or None if it was never recorded."""
+        with self._lock:
+            queue = self._entries.get(fingerprint)
+            if queue:
+                self._last[fingerprint] = queue.popleft()
+            return self._last.get(fingerprint)
+
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+
+def configure(mode, path=None, latency=None):
+    """
+    Switches the record/replay mode at runtime (e.g. from a command-line flag).
+
+    Args:
+        mode (str): "off", "record" or "replay".
+        path (str | None): Cassette file. Defaults to DOC_VISION_CASSETTE.
+        latency (str | None): "recorded" or "instant" replay.
+    """
+    global MODE, CASSETTE_PATH, REPLAY_LATENCY, _cassette
+    assert mode in _MODES, f"Unknown replay mode: {mode}"
+    with _cassette_lock:
+        MODE = mode
+        CASSETTE_PATH = path or CASSETTE_PATH
+        REPLAY_LATENCY = latency or REPLAY_LATENCY
+        _cassette = None
+
+
+def active():
+    """Returns True when calls are being recorded or replayed; caches are bypassed meanwhile (see cache.cache_disabled)."""
+    return MODE in ("record", "replay")
+
+
+def get_cassette():
+    """Returns the cassette of the current mode, loading it on first use."""
+    global _cassette
+    if _cassette is None:
+        with _cassette_lock:
+            if _cassette is None:
+                _cassette = Cassette(CASSETTE_PATH)
+    return _cassette
+
+
+def fingerprint(provider, request):
+    """Returns the SHA-256 of a provider name and a JSON-serializable request description."""
+    payload = json.dumps([provider, request], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def recorded(provider, request, func):
+    """
+    Runs an external API call through the record/replay layer.
+
+    Off: calls `func`. Record: calls `func` and appends the request fingerprint,
+    its JSON-serializable result (or error) and latency to the cassette.
+    Replay: serves the recorded result without calling `func`, waiting the
+    recorded latency unless DOC_VISION_REPLAY_LATENCY is "instant".
+
+    Args:
+        provider (str): "vision", "openai" or "language".
+        request (dict): JSON-serializable description identifying the request.
+        func (Callable[[], Any]): Performs the call; returns a JSON-serializable result.
+
+    Returns:
+        The result of `func`, live or recorded.
+
+    Raises:
+        LookupError: In replay mode, if the request was never recorded.
+        ReplayedError: In replay mode, if the recorded call failed.
+    """
+    if MODE == "off":
+        return func()
+
+    key = fingerprint(provider, request)
+    if MODE == "replay":
+        entry = get_cassette().next(key)
+        if entry is None:
+            raise LookupError(f"No recorded {provider} response for request {key[:12]} in {CASSETTE_PATH}")
+        if REPLAY_LATENCY == "recorded":
+            time.sleep(entry["elapsed"])
+        if "error" in entry:
+            raise ReplayedError(entry["error"], entry.get("status_code"))
+        return entry["response"]
+
+    entry = {"provider": provider, "fingerprint": key}
+    start = time.perf_counter()
+    try:
+        entry["response"] = result = func()
+    except Exception as e:
+        entry["error"] = str(e)
+        status = getattr(e, "status_code", None) or getattr(e, "code", None)
+        entry["status_code"] = status if isinstance(status, int) else None
+        raise
+    finally:
+        entry["elapsed"] = time.perf_counter() - start
+        get_cassette().append(entry)
+    return result
+
+
+def _error_outcome(error):
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    return {"error": str(error), "status_code": status if isinstance(status, int) else None}
+
+
+def recorded_items(provider, requests, func):
+    """
+    Runs a grouped API call (a Vision batch, a packed GPT request) through the
+    record/replay layer one item at a time.
+
+    How items are grouped depends on timing (batch waits, worker interleaving),
+    so a replay would rarely rebuild the recorded groups. Each item is recorded
+    under its own fingerprint instead, and a replay serves any grouping of
+    recorded items, waiting the longest recorded latency among them.
+
+    Args:
+        provider (str): "vision" or "openai".
+        requests (list[dict]): JSON-serializable description of each item.
+        func (Callable[[], list]): Performs the grouped call; returns one
+            JSON-serializable result per item, or an Exception for an item that failed.
+
+    Returns:
+        list: One result (or Exception) per item, live or recorded. Replayed
+        failures are ReplayedError instances.
+
+    Raises:
+        LookupError: In replay mode, if an item was never recorded.
+    """
+    if MODE == "off":
+        return func()
+
+    keys = [fingerprint(provider, request) for request in requests]
+    if MODE == "replay":
+        entries = [get_cassette().next(key) for key in keys]
+        missing = [key for key, entry in zip(keys, entries) if entry is None]
+        if missing:
+            raise LookupError(
+                f"No recorded {provider} response for {len(missing)} of {len(keys)} items "
+                f"(first: {missing[0][:12]}) in {CASSETTE_PATH}"
+            )
+        if REPLAY_LATENCY == "recorded":
+            time.sleep(max(entry["elapsed"] for entry in entries))
+        return [
+            ReplayedError(entry["error"], entry.get("status_code")) if "error" in entry else entry["response"]
+            for entry in entries
+        ]
+
+    start = time.perf_counter()
+    outcomes = []  # Nothing is recorded if the call is interrupted
+    try:
+        results = func()
+        assert len(results) == len(keys), "A grouped call must return one result per item."
+        outcomes = [_error_outcome(r) if isinstance(r, Exception) else {"response": r} for r in results]
+    except Exception as e:
+        outcomes = [_error_outcome(e)] * len(keys)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        for key, outcome in zip(keys, outcomes):
+            get_cassette().append({"provider": provider, "fingerprint": key, **outcome, "elapsed": elapsed})
+    return results
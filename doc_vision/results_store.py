@@ -0,0 +1,277 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Extracted fields indexed for lookups, with how their values are normalized
+INDEXED_FIELDS = {
+    "Nome": "text",
+    "CPF": "identifier",
+    "RG": "identifier",
+}
+
+# Documents committed together, and the longest a document waits for its group
+GROUP_SIZE = 64
+GROUP_DELAY = 2.0
+
+# Rows fetched at a time by streaming reads
+FETCH_SIZE = 256
+
+
+def normalize_value(field, value):
+    """
+    Normalizes an extracted value for its field index.
+
+    Identifiers keep only letters and digits ("123.456.789-09" -> "12345678909");
+    text is uppercased with single spaces.
+    """
+    if INDEXED_FIELDS.get(field) == "identifier":
+        return "".join(char for char in str(value).upper() if char.isalnum())
+    return " ".join(str(value).upper().split())
+
+
+class ResultStore:
+    """
+    Results of a batch run in one SQLite database (WAL), written in groups.
+
+    Documents are buffered and committed `group_size` at a time (or once the
+    oldest has waited `group_delay` seconds), so one fsync covers a whole group
+    instead of one per document. Callbacks given with a document run only after
+    its group is durable, e.g. to mark it done in the progress manifest.
+    Documents are indexed by type, input hash and the values of INDEXED_FIELDS.
+    Evaluation scores (see metric_calculation.py) are kept next to them.
+
+    Args:
+        path (str): SQLite database file.
+        group_size (int): Documents per commit.
+        group_delay (float): Seconds after which a partial group is committed on the next write.
+    """
+
+    def __init__(self, path, group_size=GROUP_SIZE, group_delay=GROUP_DELAY):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.group_size = group_size
+        self.group_delay = group_delay
+        self._pending = []
+        self._pending_since = None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # In WAL mode, FULL syncs the log on every commit, i.e. once per group
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " name TEXT PRIMARY KEY, document_type TEXT, input_hash TEXT,"
+            " result TEXT NOT NULL, result_hash TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS documents_type ON documents (document_type)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS documents_input_hash ON documents (input_hash)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fields (name TEXT NOT NULL, field TEXT NOT NULL, value TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS fields_lookup ON fields (field, value)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS fields_name ON fields (name)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS scores ("
+            " name TEXT PRIMARY KEY, result_hash TEXT NOT NULL, accuracy REAL NOT NULL,"
+            " field_results TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def add(self, name, result, input_hash=None, on_commit=None):
+        """
+        Buffers a document result, committing the group when it is full or old enough.
+
+        Args:
+            name (str): Unique document name, e.g. "RG_Aberto/00001" (a later add replaces it).
+            result (dict): The final JSON of the document.
+            input_hash (str | None): SHA-256 of the input the result was extracted from.
+            on_commit (Callable[[], None] | None): Called once the result is durable.
+        """
+        data = json.dumps(result, ensure_ascii=False)
+        with self._lock:
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+            self._pending.append((name, result, input_hash, data, on_commit))
+            if len(self._pending) < self.group_size and time.monotonic() - self._pending_since < self.group_delay:
+                return
+            callbacks = self._commit()
+        for callback in callbacks:
+            callback()
+
+    def _commit(self):
+        """Writes the pending documents in one transaction; returns their callbacks."""
+        if not self._pending:
+            return []
+        now = time.time()
+        with self._conn:
+            for name, result, input_hash, data, _ in self._pending:
+                organized = result.get("Informações Organizadas") or {}
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO documents (name, document_type, input_hash, result, result_hash, updated)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (name, result.get("Tipo de Documento"), input_hash, data,
+                     hashlib.sha256(data.encode("utf-8")).hexdigest(), now),
+                )
+                self._conn.execute("DELETE FROM fields WHERE name = ?", (name,))
+                self._conn.executemany(
+                    "INSERT INTO fields (name, field, value) VALUES (?, ?, ?)",
+                    [
+                        (name, field, normalize_value(field, organized[field]))
+                        for field in INDEXED_FIELDS
+                        if isinstance(organized.get(field), str) and organized[field].strip()
+                    ],
+                )
+        callbacks = [on_commit for *_, on_commit in self._pending if on_commit is not None]
+        self._pending = []
+        self._pending_since = None
+        return callbacks
+
+    def flush(self):
+        """Commits the buffered documents."""
+        with self._lock:
+            callbacks = self._commit()
+        for callback in callbacks:
+            callback()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+    def get(self, name):
+        """Returns the result stored under a name, or None."""
+        entry = self.get_entry(name)
+        return entry[1] if entry else None
+
+    def get_entry(self, name):
+        """
+        Returns the SHA-256 of the stored JSON and the result stored under a name.
+
+        Returns:
+            tuple[str, dict] | None: The hash and the result, or None if the name is unknown.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT result_hash, result FROM documents WHERE name = ?", (name,)).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def save_scores(self, scores):
+        """
+        Stores evaluation scores in one transaction, replacing earlier scores of the same documents.
+
+        Args:
+            scores (Iterable[tuple[str, str, float, dict]]): Name, SHA-256 of the scored result,
+                overall accuracy and per-field results of each document.
+        """
+        now = time.time()
+        rows = [
+            (name, result_hash, accuracy, json.dumps(field_results, ensure_ascii=False), now)
+            for name, result_hash, accuracy, field_results in scores
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO scores (name, result_hash, accuracy, field_results, updated)"
+                " VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def get_scores(self, name):
+        """
+        Returns the last evaluation scores of a document.
+
+        Returns:
+            dict | None: "result_hash", "accuracy" and "field_results", or None if it was never scored.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result_hash, accuracy, field_results FROM scores WHERE name = ?", (name,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"result_hash": row[0], "accuracy": row[1], "field_results": json.loads(row[2])}
+
+    def find(self, field, value):
+        """
+        Looks documents up by an indexed field (see INDEXED_FIELDS).
+
+        Returns:
+            list[str]: Names of the documents whose field has the (normalized) value.
+        """
+        assert field in INDEXED_FIELDS, f"Field {field!r} is not indexed."
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT name FROM fields WHERE field = ? AND value = ?", (field, normalize_value(field, value))
+            ).fetchall()
+        return [name for name, in rows]
+
+    def find_by_input(self, input_hash):
+        """Returns the names of the documents extracted from an input."""
+        with self._lock:
+            rows = self._conn.execute("SELECT name FROM documents WHERE input_hash = ?", (input_hash,)).fetchall()
+        return [name for name, in rows]
+
+    def iter_results(self, document_type=None, prefix=None):
+        """
+        Streams stored results without loading them all in memory.
+
+        Reads through a separate connection, so writers are not blocked while iterating.
+
+        Args:
+            document_type (str | None): Only documents of this type.
+            prefix (str | None): Only documents whose name starts with it (e.g. "RG_Aberto/").
+
+        Yields:
+            tuple[str, str, dict]: Name, SHA-256 of the stored JSON and the result.
+        """
+        for name, result_hash, data in self._stream("name, result_hash, result", document_type, prefix):
+            yield name, result_hash, json.loads(data)
+
+    def iter_hashes(self, document_type=None, prefix=None):
+        """
+        Streams the names and result hashes only, e.g. to find which results changed
+        without reading them.
+
+        Yields:
+            tuple[str, str]: Name and SHA-256 of the stored JSON.
+        """
+        yield from self._stream("name, result_hash", document_type, prefix)
+
+    def _stream(self, columns, document_type=None, prefix=None):
+        query = f"SELECT {columns} FROM documents WHERE 1 = 1"
+        params = []
+        if document_type is not None:
+            query += " AND document_type = ?"
+            params.append(document_type)
+        if prefix is not None:
+            query += " AND substr(name, 1, ?) = ?"
+            params += [len(prefix), prefix]
+
+        conn = sqlite3.connect(self.path)
+        try:
+            cursor = conn.execute(query + " ORDER BY name", params)
+            while True:
+                rows = cursor.fetchmany(FETCH_SIZE)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+
+    def export_json(self, results_dir, prefix=None):
+        """
+        Writes every stored result as a pretty-printed `<results_dir>/<name>.json`,
+        the layout of per-file results.
+
+        Returns:
+            int: Number of files written.
+        """
+        written = 0
+        for name, _, result in self.iter_results(prefix=prefix):
+            path = os.path.join(results_dir, f"{name}.json")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, indent=4)
+            written += 1
+        return written
@@ -0,0 +1,446 @@
+import json
+import threading
+
+# Placeholder replaced by the document text when a prompt is rendered
+TEXT_PLACEHOLDER = "{extracted_text}"
+
+# Resolution used to rasterize PDF pages; enough for OCR of full-page documents
+DEFAULT_DPI = 200
+
+# Longest side, in pixels, of images sent to OCR after preprocessing
+DEFAULT_OCR_MAX_SIDE = 2400
+
+
+class DocumentSchema:
+    """
+    Declarative description of a document type: its fields, extraction prompt and normalization.
+
+    Args:
+        name (str): Document type name (e.g. "CNH").
+        subject (str): How the prompt refers to the document (e.g. "uma CNH").
+        instructions (list[str]): Bullet points telling GPT what to extract.
+        text_label (str): How the prompt introduces the OCR text (e.g. "da CNH").
+        fields (dict): Field name -> example value used in the response format.
+            A list example marks a list field; a list of dicts marks a records field.
+        aliases (tuple[str]): Substrings of directory names that identify this type.
+        drop_patterns (tuple[str]): Regexes for OCR lines that never carry extractable
+            information (matched against the uppercase, accent-free line).
+        dpi (int): Resolution used to rasterize PDF pages of this type. Small cards
+            need more than full-page documents.
+        max_pages (int | None): PDF pages read for this type by default. None reads every page.
+        ocr_max_side (int): Longest side, in pixels, images of this type are downscaled
+            to before OCR. Cards have larger print than full-page documents.
+    """
+
+    def __init__(self, name, subject, instructions, text_label, fields, aliases=(), drop_patterns=(),
+                 dpi=DEFAULT_DPI, max_pages=1, ocr_max_side=DEFAULT_OCR_MAX_SIDE):
+        self.name = name
+        self.subject = subject
+        self.instructions = instructions
+        self.text_label = text_label
+        self.fields = fields
+        self.aliases = aliases
+        self.drop_patterns = drop_patterns
+        self.dpi = dpi
+        self.max_pages = max_pages
+        self.ocr_max_side = ocr_max_side
+        self._prefix, self._suffix = self._compile()
+        self._packed_prefix, self._packed_suffix = self._compile_packed()
+
+    def _compile(self):
+        """Renders the prompt once, split around the text placeholder."""
+        template = "\n".join([
+            f"Extraia as seguintes informações de {self.subject} com base no texto abaixo:",
+            *(f"- {instruction}" for instruction in self.instructions),
+            "",
+            f"Texto {self.text_label}:",
+            TEXT_PLACEHOLDER,
+            "",
+            "Responda em JSON com o formato:",
+            json.dumps(self.fields, ensure_ascii=False),
+        ])
+        prefix, suffix = template.split(TEXT_PLACEHOLDER)
+        return prefix, suffix
+
+    def _compile_packed(self):
+        """Renders the multi-document prompt once, split around the documents placeholder."""
+        template = "\n".join([
+            f"Cada documento abaixo é {self.subject} e começa com uma linha \"### ID\".",
+            "Extraia de cada documento, com base apenas no seu próprio texto:",
+            *(f"- {instruction}" for instruction in self.instructions),
+            "",
+            TEXT_PLACEHOLDER,
+            "",
+            "Responda em JSON com um objeto cujas chaves são os IDs dos documentos e cujos valores têm o formato:",
+            json.dumps(self.fields, ensure_ascii=False),
+        ])
+        prefix, suffix = template.split(TEXT_PLACEHOLDER)
+        return prefix, suffix
+
+    def field_kind(self, field):
+        """
+        Returns the kind of a field: "text", "list" or "records".
+        """
+        example = self.fields.get(field, "")
+        if isinstance(example, list):
+            return "records" if example and isinstance(example[0], dict) else "list"
+        return "text"
+
+    def render_prompt(self, extracted_text):
+        """Returns the extraction prompt for the given text."""
+        return self._prefix + extracted_text + self._suffix
+
+    def render_packed_prompt(self, documents):
+        """
+        Returns one extraction prompt for several documents of this type.
+
+        Args:
+            documents (list[tuple[str, str]]): (document ID, text) pairs.
+
+        Returns:
+            str: The prompt; the answer is expected to be keyed by document ID.
+        """
+        body = "\n\n".join(f"### {document_id}\n{text}" for document_id, text in documents)
+        return self._packed_prefix + body + self._packed_suffix
+
+    def normalize(self, data):
+        """
+        Normalizes GPT output to the schema: strips text, wraps single values
+        of list fields and adds missing fields as empty values.
+
+        Args:
+            data (dict): Extracted information.
+
+        Returns:
+            dict: The normalized information. Unknown fields are kept as they are.
+        """
+        if not isinstance(data, dict):
+            return data
+
+        normalized = dict(data)
+        for field in self.fields:
+            kind = self.field_kind(field)
+            value = normalized.get(field)
+            if value is None:
+                normalized[field] = [] if kind != "text" else ""
+            elif kind == "text" and isinstance(value, str):
+                normalized[field] = value.strip()
+            elif kind == "list":
+                values = value if isinstance(value, list) else [value]
+                normalized[field] = [v.strip() if isinstance(v, str) else v for v in values]
+        return normalized
+
+    def scored_values(self, data):
+        """
+        Returns the field values compared against ground truth by metric_calculation.
+
+        Records fields (lists of dicts) are flattened into a list of their values.
+
+        Args:
+            data (dict): Extracted information.
+
+        Returns:
+            dict: Field -> text or list of texts.
+        """
+        values = {}
+        for field, value in data.items():
+            if self.field_kind(field) == "records" or (isinstance(value, list) and any(isinstance(v, dict) for v in value)):
+                values[field] = [
+                    str(item_value) for record in value if isinstance(record, dict)
+                    for item_value in record.values() if item_value
+                ]
+            elif isinstance(value, dict):
+                values[field] = [str(v) for v in value.values() if v]
+            else:
+                values[field] = value
+        return values
+
+
+def _default_schema(document_type):
+    return DocumentSchema(
+        name=document_type,
+        subject=f"um documento do tipo {document_type}",
+        instructions=[
+            "Nome", "CPF", "RG", "Data de Nascimento", "Data de Expedição", "Naturalidade",
+            "Filiação (pai e mãe)",
+        ],
+        text_label="do documento",
+        fields={
+            "Nome": "", "CPF": "", "RG": "", "Data de Nascimento": "", "Data de Expedição": "",
+            "Naturalidade": "", "Filiação": ["Nome do Pai", "Nome da Mãe"],
+        },
+        dpi=300,
+        ocr_max_side=1600,
+    )
+
+
+def _build_registry():
+    schemas = [
+        DocumentSchema(
+            name="Certidão de Casamento",
+            subject="uma Certidão de Casamento",
+            instructions=[
+                "Nome dos noivos",
+                "Data do casamento",
+                "Regime de bens",
+                "Nome alterado (se algum dos noivos mudou de nome após o casamento)",
+                "Estado civil antes do casamento (solteiro, divorciado, etc.)",
+            ],
+            text_label="da certidão",
+            fields={
+                "Nome dos Noivos": ["Noivo", "Noiva"],
+                "Data do Casamento": "",
+                "Regime de Bens": "",
+                "Nome Alterado": ["Nome anterior -> Nome atual"],
+                "Estado Civil Antes do Casamento": ["Estado civil do Noivo", "Estado civil da Noiva"],
+            },
+            aliases=("Casamento",),
+        ),
+        DocumentSchema(
+            name="Certidão de Nascimento",
+            subject="uma Certidão de Nascimento",
+            instructions=[
+                "Nome do titular do documento",
+                "Data de nascimento",
+                "Naturalidade",
+                "Filiação (nome do pai e da mãe, se disponíveis)",
+            ],
+            text_label="da certidão",
+            fields={
+                "Nome": "",
+                "Data de Nascimento": "",
+                "Naturalidade": "",
+                "Filiação": ["Nome do Pai", "Nome da Mãe"],
+            },
+            aliases=("Nascimento",),
+        ),
+        DocumentSchema(
+            name="CNH",
+            subject="uma CNH (Carteira Nacional de Habilitação)",
+            instructions=[
+                "Nome completo",
+                "RG",
+                "CPF",
+                "Filiação (pai e mãe)",
+                "Data de validade da CNH",
+                "Local de emissão",
+            ],
+            text_label="da CNH",
+            fields={
+                "Nome": "",
+                "RG": "",
+                "CPF": "",
+                "Filiação": ["Nome do Pai", "Nome da Mãe"],
+                "Validade": "",
+                "Local de Emissão": "",
+            },
+            aliases=("CNH",),
+            drop_patterns=(
+                r"MINISTERIO DA(S CIDADES| INFRAESTRUTURA| INFRA ESTRUTURA)",
+                r"DEPARTAMENTO NACIONAL DE TRANSITO",
+                r"DENATRAN|CONTRAN|SENATRAN",
+                r"CARTEIRA NACIONAL DE HABILITACAO",
+                r"PROIBIDO PLASTIFICAR",
+                r"ASSINATURA DO (PORTADOR|EMISSOR)",
+                r"DRIVER LICENSE|PERMISO DE CONDUCCION",
+            ),
+            dpi=300,
+            ocr_max_side=1600,
+        ),
+        DocumentSchema(
+            name="RG",
+            subject="um RG (Registro Geral)",
+            instructions=[
+                "Nome completo",
+                "RG",
+                "CPF (se disponível)",
+                "Data de nascimento",
+                "Naturalidade",
+                "Filiação (pai e mãe)",
+            ],
+            text_label="do RG",
+            fields={
+                "Nome": "",
+                "RG": "",
+                "CPF": "",
+                "Data de Nascimento": "",
+                "Naturalidade": "",
+                "Filiação": ["Nome do Pai", "Nome da Mãe"],
+            },
+            aliases=("RG",),
+            drop_patterns=(
+                r"SECRETARIA (DE|DA) SEGURANCA PUBLICA",
+                r"INSTITUTO DE IDENTIFICACAO.*",
+                r"CARTEIRA DE IDENTIDADE",
+                r"LEI N?O? ?7\.?116 DE 29/08/83",
+                r"ASSINATURA DO (TITULAR|DIRETOR)",
+                r"POLEGAR DIREITO",
+            ),
+            dpi=300,
+            ocr_max_side=1600,
+        ),
+        DocumentSchema(
+            name="CPF",
+            subject="um CPF",
+            instructions=["Nome completo", "CPF", "Data de nascimento"],
+            text_label="do CPF",
+            fields={"Nome": "", "CPF": "", "Data de Nascimento": ""},
+            aliases=("CPF",),
+            drop_patterns=(
+                r"MINISTERIO DA FAZENDA",
+                r"SECRETARIA DA RECEITA FEDERAL.*",
+                r"CADASTRO DE PESSOAS FISICAS",
+            ),
+            dpi=300,
+            ocr_max_side=1600,
+        ),
+        DocumentSchema(
+            name="Comprovante de Endereço",
+            subject="um comprovante de endereço",
+            instructions=[
+                "Nome do titular do comprovante",
+                "Endereço completo (incluindo rua, número, bairro, cidade, estado e CEP)",
+            ],
+            text_label="do comprovante de endereço",
+            fields={"Nome Completo": "", "Endereço Completo": ""},
+            aliases=("Endereco", "Endereço"),
+        ),
+        DocumentSchema(
+            name="CTPS",
+            subject="uma CTPS (Carteira de Trabalho e Previdência Social)",
+            instructions=[
+                "Nome completo do titular",
+                "Ocupação atual (cargo ou função descrito no documento)",
+                "Remunerações (valores salariais mencionados, incluindo períodos de pagamento)",
+            ],
+            text_label="da CTPS",
+            fields={
+                "Nome": "",
+                "Ocupação": "",
+                "Remunerações": [{"Período": "", "Valor": ""}],
+            },
+            aliases=("CTPS",),
+            max_pages=4,
+        ),
+        DocumentSchema(
+            name="Holerite",
+            subject="um holerite",
+            instructions=["Nome do funcionário", "Salário base", "Descontos", "Valor líquido"],
+            text_label="do holerite",
+            fields={"Nome": "", "Salário Base": "", "Descontos": "", "Valor Líquido": ""},
+            aliases=("Holerite",),
+        ),
+        DocumentSchema(
+            name="Imposto de Renda",
+            subject="um documento de Imposto de Renda",
+            instructions=[
+                "Nome do declarante",
+                "CPF do declarante",
+                "Natureza do rendimento",
+                "Valor dos rendimentos",
+            ],
+            text_label="do documento",
+            fields={"Nome": "", "CPF": "", "Natureza do Rendimento": "", "Valor dos Rendimentos": ""},
+            aliases=("Imposto", "IRPF"),
+            max_pages=4,
+        ),
+        DocumentSchema(
+            name="Driver's License",
+            subject="um documento de Driver's License",
+            instructions=[
+                "Nome", "Número da CNH", "Data de Nascimento", "Endereço", "Classe",
+                "Data de Expiração", "Data de Emissão", "Altura", "Sexo", "Cor dos Olhos",
+            ],
+            text_label="do documento",
+            fields={
+                "Nome": "",
+                "Número da CNH": "",
+                "Data de Nascimento": "",
+                "Endereço": "",
+                "Classe": "",
+                "Data de Expiração": "",
+                "Data de Emissão": "",
+                "Altura": "",
+                "Sexo": "",
+                "Cor dos Olhos": "",
+            },
+            aliases=("License",),
+            dpi=300,
+            ocr_max_side=1600,
+        ),
+        DocumentSchema(
+            name="FGTS",
+            subject="um extrato do FGTS",
+            instructions=[
+                "Nome do trabalhador",
+                "Nome das empresas onde o trabalhador teve vínculo",
+                "Valores depositados por cada empresa",
+            ],
+            text_label="do extrato do FGTS",
+            fields={
+                "Nome": "",
+                "Empresas": [{"Empresa": "", "Valor Depositado": ""}],
+            },
+            aliases=("FGTS",),
+            max_pages=4,
+        ),
+    ]
+    return {schema.name: schema for schema in schemas}
+
+
+_registry = None
+_defaults = {}
+_lock = threading.Lock()
+
+
+def get_registry():
+    """
+    Returns the registered schemas, building them (and their prompts) on first use.
+
+    Returns:
+        dict: Document type -> DocumentSchema.
+    """
+    global _registry
+    if _registry is None:
+        with _lock:
+            if _registry is None:
+                _registry = _build_registry()
+    return _registry
+
+
+def get_schema(document_type):
+    """
+    Returns the schema for a document type.
+
+    Unknown types get a generic schema that extracts the usual identity fields.
+
+    Args:
+        document_type (str): The type of the document (e.g., CNH, RG, etc.).
+
+    Returns:
+        DocumentSchema: The schema of the document type.
+    """
+    schema = get_registry().get(document_type)
+    if schema is None:
+        with _lock:
+            schema = _defaults.get(document_type)
+            if schema is None:
+                schema = _defaults[document_type] = _default_schema(document_type)
+    return schema
+
+
+def detect_document_type(name, default="Unknown Document"):
+    """
+    Determines the document type from a directory or file name using the schema aliases.
+
+    Args:
+        name (str): Directory or file name (e.g. "data/CNH_Aberta").
+        default (str): Type returned when no alias matches.
+
+    Returns:
+        str: The document type.
+    """
+    for schema in get_registry().values():
+        if any(alias in name for alias in schema.aliases):
+            return schema.name
+    return default
@@ -0,0 +1,272 @@
+import contextlib
+import functools
+import itertools
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from . import metrics
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# JSONL file receiving one line per finished span; unset disables the trace
+TRACE_PATH = os.environ.get("DOC_VISION_TRACE")
+
+# Payload logging: 0 logs nothing, 1 logs payloads truncated to PAYLOAD_PREVIEW characters, 2 logs them in full
+PAYLOAD_LOG_LEVEL = int(os.environ.get("DOC_VISION_PAYLOAD_LOG", "1"))
+
+# Fraction of payloads logged, so a busy batch does not flood the output
+PAYLOAD_LOG_SAMPLE = float(os.environ.get("DOC_VISION_PAYLOAD_SAMPLE", "1.0"))
+
+PAYLOAD_PREVIEW = 200
+
+
+class Histogram:
+    """
+    Cumulative latency histogram with fixed buckets, as exported to Prometheus.
+
+    Args:
+        buckets (tuple[float]): Sorted bucket upper bounds, in seconds.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """
+        Estimates a quantile by linear interpolation inside its bucket.
+
+        Returns:
+            float | None: The estimate in seconds, None without observations. Values
+            above the last bucket are reported as its upper bound.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+_histograms = {}
+_errors = {}
+_lock = threading.Lock()
+
+_trace_file = None
+_trace_lock = threading.Lock()
+_span_ids = itertools.count(1)
+_local = threading.local()
+
+
+def configure(trace_path=None, payload_level=None, payload_sample=None):
+    """
+    Changes the tracing settings at runtime (e.g. from command-line flags).
+
+    Args:
+        trace_path (str | None): JSONL trace file. None keeps the current one.
+        payload_level (int | None): Payload logging level (0, 1 or 2).
+        payload_sample (float | None): Fraction of payloads logged.
+    """
+    global TRACE_PATH, PAYLOAD_LOG_LEVEL, PAYLOAD_LOG_SAMPLE, _trace_file
+    with _trace_lock:
+        if trace_path is not None and trace_path != TRACE_PATH:
+            if _trace_file is not None:
+                _trace_file.close()
+                _trace_file = None
+            TRACE_PATH = trace_path
+    if payload_level is not None:
+        PAYLOAD_LOG_LEVEL = payload_level
+    if payload_sample is not None:
+        PAYLOAD_LOG_SAMPLE = payload_sample
+
+
+def _write_trace(record):
+    global _trace_file
+    line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+    with _trace_lock:
+        if _trace_file is None:
+            os.makedirs(os.path.dirname(TRACE_PATH) or ".", exist_ok=True)
+            _trace_file = open(TRACE_PATH, "a", encoding="utf-8", buffering=1)
+        _trace_file.write(line)
+
+
+class span(contextlib.ContextDecorator):
+    """
+    Times a pipeline stage, as a context manager or a decorator.
+
+    Every span adds its duration to the stage's histogram and counts the calls
+    that raised. With a trace file configured, it is also written to the trace
+    with its parent span, thread and attributes.
+
+    Args:
+        stage (str): Stage name (e.g. "vision_ocr").
+        **attributes: JSON-serializable details stored in the trace (e.g. images=4).
+    """
+
+    def __init__(self, stage, **attributes):
+        self.stage = stage
+        self.attributes = attributes
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        self._id = next(_span_ids)
+        self._parent = stack[-1] if stack else None
+        stack.append(self._id)
+        self._wall_start = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._start
+        _local.stack.pop()
+        with _lock:
+            histogram = _histograms.get(self.stage)
+            if histogram is None:
+                histogram = _histograms[self.stage] = Histogram()
+            histogram.observe(elapsed)
+            if exc_type is not None:
+                _errors[self.stage] = _errors.get(self.stage, 0) + 1
+
+        if TRACE_PATH:
+            record = {
+                "span": self._id, "parent": self._parent, "stage": self.stage,
+                "start": self._wall_start, "duration": elapsed, "thread": threading.current_thread().name,
+            }
+            if self.attributes:
+                record["attributes"] = self.attributes
+            if exc is not None:
+                record["error"] = f"{exc_type.__name__}: {exc}"
+            _write_trace(record)
+        return False
+
+    def __call__(self, func):
+        # A fresh span per call, so concurrent calls never share the start time
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(self.stage, **self.attributes):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def stage_stats():
+    """
+    Returns the latency summary of every stage seen so far.
+
+    Returns:
+        dict: Stage -> calls, errors, total seconds and estimated p50/p95/p99.
+    """
+    with _lock:
+        return {
+            stage: {
+                "calls": histogram.count,
+                "errors": _errors.get(stage, 0),
+                "seconds": histogram.sum,
+                "p50": histogram.quantile(0.5),
+                "p95": histogram.quantile(0.95),
+                "p99": histogram.quantile(0.99),
+            }
+            for stage, histogram in sorted(_histograms.items())
+        }
+
+
+def reset():
+    """Clears the histograms and error counts."""
+    with _lock:
+        _histograms.clear()
+        _errors.clear()
+
+
+def _metric_name(name):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def prometheus_text():
+    """
+    Renders the stage histograms and the counters of doc_vision.metrics in the
+    Prometheus text exposition format.
+    """
+    lines = [
+        "# HELP doc_vision_stage_seconds Duration of each pipeline stage.",
+        "# TYPE doc_vision_stage_seconds histogram",
+    ]
+    with _lock:
+        histograms = {stage: (list(h.counts), h.count, h.sum) for stage, h in sorted(_histograms.items())}
+        errors = dict(_errors)
+
+    for stage, (counts, count, total) in histograms.items():
+        cumulative = 0
+        for bound, bucket_count in zip(BUCKETS, counts):
+            cumulative += bucket_count
+            lines.append(f'doc_vision_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'doc_vision_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+        lines.append(f'doc_vision_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+        lines.append(f'doc_vision_stage_seconds_count{{stage="{stage}"}} {count}')
+
+    lines += [
+        "# HELP doc_vision_stage_errors_total Stage calls that raised.",
+        "# TYPE doc_vision_stage_errors_total counter",
+    ]
+    for stage in histograms:
+        lines.append(f'doc_vision_stage_errors_total{{stage="{stage}"}} {errors.get(stage, 0)}')
+
+    for name, value in sorted(metrics.snapshot().items()):
+        metric = f"doc_vision_{_metric_name(name)}_total"
+        lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+def export_prometheus(path):
+    """
+    Writes the metrics to a Prometheus text file (e.g. for the node_exporter textfile collector).
+
+    The file is written under a temporary name and renamed, so a scraper never reads it half written.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=".prom")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(prometheus_text())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def log_payload(label, payload):
+    """
+    Prints a debug payload (OCR text, final JSON) according to the payload log level and sampling.
+
+    Args:
+        label (str): Line prefix, e.g. "📝 DEBUG: Texto extraído:".
+        payload (str | Callable[[], str]): The payload, or a function building it, so
+            payloads that are not logged are never rendered.
+    """
+    if PAYLOAD_LOG_LEVEL <= 0 or (PAYLOAD_LOG_SAMPLE < 1 and random.random() >= PAYLOAD_LOG_SAMPLE):
+        return
+    text = payload() if callable(payload) else payload
+    if PAYLOAD_LOG_LEVEL == 1 and len(text) > PAYLOAD_PREVIEW:
+        text = f"{text[:PAYLOAD_PREVIEW]}... ({len(text)} caracteres)"
+    print(f"{label} {text}")
@@ -1,16 +1,24 @@
-from google.cloud import language_v1
+from .clients import get_language_client
+from .ratelimit import get_limiter
+from .replay import recorded
 
 def google_nlp_analyze_entities(text_content):
     """Uses Google Natural Language API to analyze entities in text."""
-    client = language_v1.LanguageServiceClient()
+    return recorded("language", {"method": "analyze_entities", "text": text_content},
+                    lambda: _analyze_entities(text_content))
+
+def _analyze_entities(text_content):
+    from google.cloud import language_v1  # Deferred: the SDK is slow to import
+
+    client = get_language_client()
 
     # Create a document for the text content
     document = language_v1.Document(
         content=text_content, type_=language_v1.Document.Type.PLAIN_TEXT
     )
 
-    # Perform entity analysis
-    response = client.analyze_entities(document=document)
+    # Perform entity analysis; retry=None leaves retries to the rate limiter
+    response = get_limiter("language").call(client.analyze_entities, document=document, retry=None)
 
     # Organize entities into a dictionary
     entities = {}
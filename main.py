@@ -1,88 +1,361 @@
+import argparse
+import fnmatch
 import json
 import os
 import logging
-from doc_vision.process_document import process_document
-from doc_vision.decorators import vote, has_valid_data
+from doc_vision.process_document import build_result, extract_document_text, extract_texts, organize_document
+from doc_vision.packing import PACK_TOKEN_BUDGET, gpt_extract_packed
+from doc_vision.decorators import has_valid_data
+from doc_vision.pipeline import Stage, run_pipeline
+from doc_vision.schemas import detect_document_type
+from doc_vision.progress import ProgressManifest, in_shard, merge_manifests, parse_shard
+from doc_vision.results_store import ResultStore
+from doc_vision import metrics, replay, tracing
 
 # Configure logging for debugging
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 
-def process_document_with_vote(image_path, document_type):
+def process_document_with_vote(extracted_text, document_type, samples=5):
     """
-    Process a document using the voting mechanism if the first attempt fails.
-    
+    Process a document's text using the voting mechanism if the first attempt fails.
+
+    The OCR text is reused; GPT returns all candidates in a single request.
+
     Args:
-        image_path (str): The file path of the document image.
+        extracted_text (str): The visible text of the document.
         document_type (str): The type of the document (e.g., CNH, RG, etc.).
-    
+        samples (int): Number of GPT candidates to vote over.
+
     Returns:
         dict: The processed document data.
     """
-    logging.warning(f"⚠️ Retrying {image_path} with vote(5)...")
-    voted_process = vote(5)(process_document)
-    return voted_process(image_path, document_type)
+    return organize_document(extracted_text, document_type, samples=samples)
 
-if __name__ == "__main__":
-    # Define input and output directories
-    input_dirs = ["data/CNH_Aberta", "data/RG_Aberto"]
-    results_dir = "results"
+# Inputs processed when none are given on the command line
+DEFAULT_INPUT_DIRS = ["data/CNH_Aberta", "data/RG_Aberto"]
+DEFAULT_PATTERN = "*_in.jpg"
 
-    # Ensure results directory exists
-    os.makedirs(results_dir, exist_ok=True)
+def parse_input(value):
+    """
+    Parses an input given as "DIR" or "DIR=TYPE".
+
+    Without a type, the document type is detected from the directory name.
+
+    Returns:
+        tuple[str, str]: The directory and its document type.
+    """
+    input_dir, _, document_type = value.partition("=")
+    return input_dir, document_type or detect_document_type(os.path.basename(os.path.normpath(input_dir)))
+
+def output_name(file_name, pattern):
+    """Strips the literal suffix of the pattern (e.g. "_in.jpg" of "*_in.jpg"), or else the extension."""
+    suffix = pattern.rsplit("*", 1)[-1]
+    if "*" in pattern and suffix and not any(char in suffix for char in "?[") and file_name.endswith(suffix):
+        return file_name[:-len(suffix)]
+    return os.path.splitext(file_name)[0]
+
+def walk_inputs(root, pattern):
+    """
+    Yields the files under a directory matching the pattern, as they are found.
+
+    The tree is walked with os.scandir, so a large directory is never listed in full before work starts.
+
+    Yields:
+        tuple[str, str]: The file path and its path relative to `root`.
+    """
+    pending = [""]
+    while pending:
+        relative_dir = pending.pop()
+        with os.scandir(os.path.join(root, relative_dir)) as entries:
+            for entry in entries:
+                relative = os.path.join(relative_dir, entry.name)
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(relative)
+                elif entry.is_file() and fnmatch.fnmatch(entry.name, pattern):
+                    yield entry.path, relative
+
+def iter_jobs(inputs, results_dir, pattern=DEFAULT_PATTERN, progress=None, shard=(0, 1), max_attempts=3):
+    """
+    Yields one job per input image found in the input directories.
+
+    With a progress manifest, inputs already done (or failed `max_attempts`
+    times) are skipped, and each yielded job is recorded as a new attempt.
+    With a shard, only the inputs of that shard are yielded.
 
-    failed_files = []
+    Args:
+        inputs (list[tuple[str, str]]): Input directories and their document types.
+        results_dir (str): Root directory for the JSON results.
+        pattern (str): Shell-style pattern of the input file names.
+        progress (ProgressManifest | None): Manifest of the run.
+        shard (tuple[int, int]): Index and count of the shard to process.
+        max_attempts (int): Attempts after which a failing input is no longer retried.
 
-    for input_dir in input_dirs:
+    Yields:
+        dict: Job description with the paths, content hash and document type of an image, and the
+        name of its result (its path under `results_dir`, without extension).
+    """
+    for input_dir, document_type in inputs:
         logging.info(f"📂 Processing directory: {input_dir}")
+        sub_results_dir = os.path.join(results_dir, os.path.basename(os.path.normpath(input_dir)))
+
+        for image_path, relative in walk_inputs(input_dir, pattern):
+            name = f"{os.path.basename(os.path.normpath(input_dir))}/{relative}"
+            if not in_shard(name, *shard):
+                continue
+
+            input_hash = None
+            if progress is not None:
+                input_hash = progress.content_hash(image_path)
+                if not progress.should_process(input_hash, max_attempts):
+                    metrics.increment("inputs_skipped")
+                    continue
+                progress.start(input_hash, image_path)
+
+            output_file = os.path.join(
+                sub_results_dir, os.path.dirname(relative), f"{output_name(os.path.basename(relative), pattern)}.json"
+            )
+            yield {
+                "name": os.path.splitext(os.path.relpath(output_file, results_dir))[0].replace(os.sep, "/"),
+                "file_name": relative,
+                "image_path": image_path,
+                "input_hash": input_hash,
+                "output_file": output_file,
+                "document_type": document_type,
+            }
+
+def ocr_stage(job):
+    """Runs Google Vision OCR on the job's image."""
+    logging.info(f"🔎 Processing {job['file_name']}...")
+    job["extracted_text"] = extract_document_text(job["image_path"], job["document_type"])
+    return job
+
+def ocr_batch_stage(jobs):
+    """Runs Google Vision OCR on several jobs' images with batched requests."""
+    logging.info(f"🔎 Processing {len(jobs)} documents in one OCR batch...")
+    results = []
+    images = [job["image_path"] for job in jobs]
+    for job, text in zip(jobs, extract_texts(images, [job["document_type"] for job in jobs])):
+        if isinstance(text, Exception):
+            results.append(text)
+            continue
+        try:
+            # Empty text falls back to the single-image path and its retry logic
+            job["extracted_text"] = text if text.strip() else extract_document_text(job["image_path"], job["document_type"])
+        except Exception as e:
+            results.append(e)
+            continue
+        results.append(job)
+    return results
 
-        sub_results_dir = os.path.join(results_dir, os.path.basename(input_dir))
-        os.makedirs(sub_results_dir, exist_ok=True)
+def extraction_stage(job):
+    """Organizes the OCR text with GPT, retrying with vote(5) when the result is invalid."""
+    try:
+        result = organize_document(job["extracted_text"], job["document_type"])
+    except Exception as e:
+        logging.error(f"❌ Extraction error for {job['file_name']}: {e}")
+        result = None
 
-        for file_name in os.listdir(input_dir):
-            if not file_name.endswith("_in.jpg"):
-                continue  # Skip non-image files
+    job["result"] = result
+    return retry_invalid_with_vote(job)
 
-            base_name = file_name.replace("_in.jpg", "")
-            image_path = os.path.join(input_dir, file_name)
-            output_file = os.path.join(sub_results_dir, f"{base_name}.json")
+def retry_invalid_with_vote(job):
+    """Retries the job with vote(5) when its result is missing or invalid."""
+    if not has_valid_data((job["result"] or {}).get("Informações Organizadas", {})):
+        logging.warning(f"⚠️ Processing failed for {job['file_name']}. Retrying with vote(5)...")
+        metrics.increment("extraction_retries")
+        result = process_document_with_vote(job["extracted_text"], job["document_type"])
 
+        if not has_valid_data((result or {}).get("Informações Organizadas", {})):
+            raise ValueError(f"Final processing attempt failed for {job['file_name']}")
+        job["result"] = result
+
+    return job
+
+def packed_extraction_stage(jobs, token_budget=PACK_TOKEN_BUDGET):
+    """
+    Organizes several jobs' OCR text with packed GPT requests, one group per document type.
+
+    Documents left invalid after the packed request and their single retry are retried with vote(5).
+    """
+    logging.info(f"📦 Packing {len(jobs)} documents into GPT requests...")
+    by_type = {}
+    for index, job in enumerate(jobs):
+        by_type.setdefault(job["document_type"], {})[index] = job["extracted_text"]
+
+    results = [None] * len(jobs)
+    for document_type, texts in by_type.items():
+        for index, organized_data in gpt_extract_packed(texts, document_type, token_budget=token_budget).items():
+            job = jobs[index]
+            if isinstance(organized_data, Exception):
+                logging.error(f"❌ Extraction error for {job['file_name']}: {organized_data}")
+                job["result"] = None
+            else:
+                job["result"] = build_result(job["extracted_text"], document_type, organized_data)
             try:
-                logging.info(f"🔎 Processing {file_name}...")
-
-                # Determine document type based on folder name
-                document_type = (
-                    "CNH" if "CNH" in input_dir else
-                    "RG" if "RG" in input_dir else
-                    "Marriage Certificate" if "Casamento" in input_dir else
-                    "Payslip" if "Holerite" in input_dir else
-                    "FGTS" if "FGTS" in input_dir else
-                    "Unknown Document"
-                )
-
-                # Process document
-                result = process_document(image_path, document_type)
-
-                # Check if the result is valid
-                if not has_valid_data(result.get("Informações Organizadas", {})):
-                    logging.warning(f"⚠️ Processing failed for {file_name}. Retrying with vote(5)...")
-                    result = process_document_with_vote(image_path, document_type)
-
-                    if not has_valid_data(result.get("Informações Organizadas", {})):
-                        logging.error(f"❌ Final processing attempt failed for {file_name}. Skipping.")
-                        failed_files.append(file_name)
-                        continue
-
-                # Save the result
-                with open(output_file, "w", encoding="utf-8") as f:
-                    json.dump(result, f, ensure_ascii=False, indent=4)
+                results[index] = retry_invalid_with_vote(job)
+            except Exception as e:
+                results[index] = e
+    return results
+
+def write_stage(job, progress=None, store=None, json_files=True):
+    """
+    Saves the job's result and records the input as done in the progress manifest.
+
+    With a result store, the result joins the store's next group commit and is
+    marked done once that commit is durable; JSON files are then only an export
+    and are not fsynced one by one. Without a store, the JSON file is fsynced
+    before the input is marked done.
+    """
+    with tracing.span("result_write"):
+        if store is not None:
+            on_commit = (lambda: progress.done(job["input_hash"], job["name"])) if progress is not None else None
+            store.add(job["name"], job["result"], job["input_hash"], on_commit=on_commit)
+
+        if json_files:
+            os.makedirs(os.path.dirname(job["output_file"]), exist_ok=True)
+            with open(job["output_file"], "w", encoding="utf-8") as f:
+                json.dump(job["result"], f, ensure_ascii=False, indent=4)
+                if store is None:
                     f.flush()
                     os.fsync(f.fileno())
 
-                logging.info(f"✅ Successfully processed {file_name}. Result saved at '{output_file}'.")
+    if progress is not None and store is None:
+        progress.done(job["input_hash"], job["output_file"])
 
-            except Exception as e:
-                logging.error(f"❌ Error processing {file_name}: {e}")
-                failed_files.append(file_name)
+    logging.info(f"✅ Successfully processed {job['file_name']} as '{job['name']}'.")
+    return job
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Batch document processing.")
+    parser.add_argument("--input", action="append", metavar="DIR[=TYPE]",
+                        help="Input directory, walked recursively, optionally with its document type "
+                             "(detected from the directory name otherwise). Repeatable.")
+    parser.add_argument("--pattern", default=DEFAULT_PATTERN, help="Shell-style pattern of the input file names.")
+    parser.add_argument("--results-dir", default="results", help="Root directory for the JSON results.")
+    parser.add_argument("--shard", default="0/1", help="Process only shard i of N (i/N), e.g. 0/4 on the first node.")
+    parser.add_argument("--progress", help="Progress manifest. Defaults to <results-dir>/progress[.shard-i-of-N].jsonl.")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Attempts after which a failing input is skipped.")
+    parser.add_argument("--fresh", action="store_true", help="Ignore the progress manifest and process every input.")
+    parser.add_argument("--sink", choices=["store", "json", "both"], default="store",
+                        help="Save results in the SQLite result store, as one JSON file per document, or both.")
+    parser.add_argument("--store", help="Result store. Defaults to <results-dir>/results.sqlite3.")
+    parser.add_argument("--export-json", action="store_true",
+                        help="Export the result store as one JSON file per document and exit.")
+    parser.add_argument("--merge-progress", nargs="+", metavar="MANIFEST",
+                        help="Merge shard manifests into the --progress manifest and exit.")
+    parser.add_argument("--ocr-workers", type=int, default=4, help="Concurrent Google Vision requests.")
+    parser.add_argument("--gpt-workers", type=int, default=4, help="Concurrent GPT extractions.")
+    parser.add_argument("--ocr-batch-size", type=int, default=1,
+                        help="Images per Google Vision request; above 1 enables batched OCR.")
+    parser.add_argument("--pack-size", type=int, default=1,
+                        help="Same-type documents per GPT request; above 1 enables packed extraction.")
+    parser.add_argument("--pack-token-budget", type=int, default=PACK_TOKEN_BUDGET,
+                        help="Estimated OCR tokens per packed GPT request.")
+    parser.add_argument("--write-workers", type=int, default=1, help="Concurrent result writers.")
+    parser.add_argument("--queue-size", type=int, default=8, help="Maximum documents waiting in front of each stage.")
+    parser.add_argument("--record", metavar="CASSETTE", help="Record every API call of the run into this cassette.")
+    parser.add_argument("--replay", metavar="CASSETTE", help="Serve API calls from this cassette, without network access.")
+    parser.add_argument("--replay-latency", choices=["recorded", "instant"], default="recorded",
+                        help="Replay calls with their recorded latency or instantly.")
+    parser.add_argument("--metrics-file", help="Write stage histograms and counters to this Prometheus text file.")
+    parser.add_argument("--trace", metavar="JSONL", help="Append every timed span to this JSONL trace.")
+    parser.add_argument("--payload-log", type=int, choices=[0, 1, 2],
+                        help="Debug payload logging: 0 off, 1 truncated, 2 full. Defaults to DOC_VISION_PAYLOAD_LOG.")
+    parser.add_argument("--payload-sample", type=float, help="Fraction of debug payloads logged.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    shard = parse_shard(args.shard)
+    progress_path = args.progress or os.path.join(
+        args.results_dir, "progress.jsonl" if shard[1] == 1 else f"progress.shard-{shard[0]}-of-{shard[1]}.jsonl"
+    )
+
+    store_path = args.store or os.path.join(args.results_dir, "results.sqlite3")
+    if args.export_json:
+        store = ResultStore(store_path)
+        logging.info(f"📤 Exported {store.export_json(args.results_dir)} results from {store_path}")
+        store.close()
+        raise SystemExit(0)
+
+    if args.merge_progress:
+        counts = merge_manifests(args.merge_progress, progress_path)
+        logging.info(f"🧩 Merged {len(args.merge_progress)} manifests into {progress_path}: {counts}")
+        raise SystemExit(0)
+
+    if args.record:
+        replay.configure("record", args.record)
+    elif args.replay:
+        replay.configure("replay", args.replay, args.replay_latency)
+    tracing.configure(args.trace, args.payload_log, args.payload_sample)
+
+    # Define input and output directories
+    inputs = [parse_input(value) for value in args.input or DEFAULT_INPUT_DIRS]
+    results_dir = args.results_dir
+
+    # Ensure results directory exists
+    os.makedirs(results_dir, exist_ok=True)
+    if args.fresh and os.path.exists(progress_path):
+        os.remove(progress_path)
+    # Recording or replaying must see every input, so progress from earlier runs is not applied
+    if replay.active():
+        logging.info("📼 Record/replay mode: the progress manifest is not used, every input is processed.")
+        progress = None
+    else:
+        progress = ProgressManifest(progress_path)
+    store = ResultStore(store_path) if args.sink in ("store", "both") else None
+
+    stages = [
+        Stage("ocr", ocr_batch_stage, workers=args.ocr_workers, batch_size=args.ocr_batch_size)
+        if args.ocr_batch_size > 1 else
+        Stage("ocr", ocr_stage, workers=args.ocr_workers),
+        Stage("extraction", lambda jobs: packed_extraction_stage(jobs, args.pack_token_budget),
+              workers=args.gpt_workers, batch_size=args.pack_size)
+        if args.pack_size > 1 else
+        Stage("extraction", extraction_stage, workers=args.gpt_workers),
+        Stage("write", lambda job: write_stage(job, progress, store, json_files=args.sink != "store"),
+              workers=args.write_workers),
+    ]
+    jobs = iter_jobs(inputs, results_dir, args.pattern, progress, shard, args.max_attempts)
+    try:
+        _, failures = run_pipeline(jobs, stages, queue_size=args.queue_size)
+        if progress is not None:
+            for job, _, error in failures:
+                progress.failed(job["input_hash"], error)
+    finally:
+        # Inputs interrupted mid-run stay "started" and are retried by the next run
+        if store is not None:
+            store.close()
+        if progress is not None:
+            progress.close()
+
+    failed_files = [job["file_name"] for job, _, _ in failures]
+    if progress is not None:
+        logging.info(
+            f"🗂️ Progress ({progress_path}): {progress.counts()}, skipped this run: {metrics.get('inputs_skipped')}"
+        )
+
+    counters = metrics.snapshot()
+    logging.info(
+        f"📊 Vision requests: {counters.get('vision_requests', 0)}, "
+        f"GPT requests: {counters.get('gpt_requests', 0)}, "
+        f"packed: {counters.get('gpt_packed_requests', 0)} for {counters.get('gpt_packed_documents', 0)} documents "
+        f"({counters.get('gpt_packed_retries', 0)} sent again alone), "
+        f"retries: {counters.get('extraction_retries', 0)}, "
+        f"throttled: {counters.get('vision_throttled', 0)} Vision / {counters.get('openai_throttled', 0)} GPT, "
+        f"JSON repaired locally: {counters.get('json_repaired', 0)}, "
+        f"JSON parse failures: {counters.get('json_parse_failures', 0)}, "
+        f"prompt tokens saved by compaction: {counters.get('prompt_tokens_saved', 0)} "
+        f"of {counters.get('prompt_tokens_before', 0)}"
+    )
+
+    for stage, stats in tracing.stage_stats().items():
+        logging.info(
+            f"⏱️ {stage}: {stats['calls']} calls, {stats['errors']} errors, "
+            f"p50 {stats['p50']:.3f}s, p95 {stats['p95']:.3f}s, total {stats['seconds']:.1f}s"
+        )
+    if args.metrics_file:
+        tracing.export_prometheus(args.metrics_file)
 
     # Show failed files summary
     if failed_files:
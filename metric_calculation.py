@@ -1,8 +1,18 @@
 import os
+import csv
+import hashlib
+import inspect
+import io
 import json
+import tempfile
 import unicodedata
 import re
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from difflib import SequenceMatcher
+from doc_vision.results_store import ResultStore
+from doc_vision.schemas import detect_document_type, get_schema
 
 def clean_text(text, preserve_accents=False):
     """
@@ -54,13 +64,72 @@ def extract_ground_truth_text(txt_path):
     transcriptions = [line.split(",")[-1].strip() for line in lines if "," in line]
     return set(clean_text(t, preserve_accents=True) for t in transcriptions)
 
+class GroundTruthIndex:
+    """
+    Ground-truth values normalized once and indexed for fuzzy lookups.
+
+    Candidates are bucketed by length and pruned with upper bounds of the
+    SequenceMatcher ratio (length, then shared characters) before the exact
+    ratio is computed, so a lookup gives the same answer as comparing the
+    value against every ground-truth entry.
+
+    Args:
+        ground_truth_text (Iterable[str]): Ground-truth values.
+    """
+
+    def __init__(self, ground_truth_text):
+        entries = sorted({clean_text(gt, preserve_accents=True) for gt in ground_truth_text}, key=len)
+        self.entries = entries
+        self.lengths = [len(entry) for entry in entries]
+        self.char_counts = [Counter(entry) for entry in entries]
+        self._matchers = [None] * len(entries)
+
+    def _matcher(self, position):
+        # SequenceMatcher caches its analysis of the second sequence, so each entry is analyzed once
+        matcher = self._matchers[position]
+        if matcher is None:
+            matcher = self._matchers[position] = SequenceMatcher(None, "", self.entries[position])
+        return matcher
+
+    def matches(self, normalized_value, threshold):
+        """
+        Returns True if `similar(normalized_value, gt) >= threshold` for any ground-truth entry.
+
+        Stops at the first entry reaching the threshold.
+        """
+        size = len(normalized_value)
+        if size == 0:
+            return bool(self.entries) and self.lengths[0] == 0
+
+        # 2 * min(a, b) / (a + b) >= threshold bounds the lengths worth comparing
+        low = bisect_left(self.lengths, int(size * threshold / (2 - threshold)))
+        high = bisect_right(self.lengths, int(size * (2 - threshold) / threshold) + 1)
+        candidates = sorted(range(low, high), key=lambda position: abs(self.lengths[position] - size))
+
+        value_counts = None
+        for position in candidates:
+            total = size + self.lengths[position]
+            if 2.0 * min(size, self.lengths[position]) / total < threshold:
+                continue
+            if value_counts is None:
+                value_counts = Counter(normalized_value)
+            shared = sum((value_counts & self.char_counts[position]).values())
+            if 2.0 * shared / total < threshold:
+                continue
+            matcher = self._matcher(position)
+            matcher.set_seq1(normalized_value)
+            if matcher.ratio() >= threshold:
+                return True
+        return False
+
+
 def check_field_accuracy(organized_info, ground_truth_text):
     """
     Verifies if extracted fields match the ground truth with a flexible similarity threshold.
     
     Args:
         organized_info (dict): Extracted fields from a document.
-        ground_truth_text (set): Ground truth values.
+        ground_truth_text (set | GroundTruthIndex): Ground truth values, or an index built from them.
     
     Returns:
         tuple: A dictionary of matched results and the overall accuracy.
@@ -70,13 +139,16 @@ def check_field_accuracy(organized_info, ground_truth_text):
     matched_fields = 0
     similarity_threshold = 0.75  
 
+    if not isinstance(ground_truth_text, GroundTruthIndex):
+        ground_truth_text = GroundTruthIndex(ground_truth_text)
+
     for key, value in organized_info.items():
         if isinstance(value, list):
             sub_results = []
             for item in value:
                 total_fields += 1
                 normalized_item = clean_text(item, preserve_accents=True)
-                matched = any(similar(normalized_item, clean_text(gt, preserve_accents=True)) >= similarity_threshold for gt in ground_truth_text)
+                matched = ground_truth_text.matches(normalized_item, similarity_threshold)
                 sub_results.append({"value": item, "matched": matched})
                 if matched:
                     matched_fields += 1
@@ -84,7 +156,7 @@ def check_field_accuracy(organized_info, ground_truth_text):
         else:
             total_fields += 1
             normalized_value = clean_text(value, preserve_accents=True)
-            matched = any(similar(normalized_value, clean_text(gt, preserve_accents=True)) >= similarity_threshold for gt in ground_truth_text)
+            matched = ground_truth_text.matches(normalized_value, similarity_threshold)
             results[key] = {"value": value, "matched": matched}
             if matched:
                 matched_fields += 1
@@ -92,6 +164,209 @@ def check_field_accuracy(organized_info, ground_truth_text):
     accuracy = matched_fields / total_fields if total_fields > 0 else 0
     return results, accuracy
 
+def file_state(path):
+    """Returns the (modification time, size) of a file, used to skip hashing unchanged files."""
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+def file_hash(path):
+    """Returns the SHA-256 of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def write_atomic(path, text):
+    """Writes a text file through a temporary file and a rename, so readers never see it half written."""
+    directory = os.path.dirname(path) or "."
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def field_counts(field_results):
+    """Summarizes field results as field -> [matched, total]."""
+    counts = {}
+    for field, result in field_results.items():
+        items = result if isinstance(result, list) else [result]
+        counts[field] = [sum(1 for item in items if item["matched"]), len(items)]
+    return counts
+
+def score_result(json_data, txt_file, default_document_type):
+    """
+    Scores one document result against its ground truth.
+
+    Returns:
+        tuple: The report ("accuracy" and per-field "fields" counts, or "error")
+        and the field results (None on error).
+    """
+    extracted_info = json_data.get("Informações Organizadas", {})
+    if not extracted_info:
+        return {"error": "JSON missing organized information"}, None
+
+    # Field handling (e.g. flattening records) comes from the document type's schema
+    document_type = json_data.get("Tipo de Documento") or default_document_type
+    scored_info = get_schema(document_type).scored_values(extracted_info)
+
+    ground_truth_text = extract_ground_truth_text(txt_file)
+    field_results, overall_accuracy = check_field_accuracy(scored_info, ground_truth_text)
+    return {"accuracy": overall_accuracy, "fields": field_counts(field_results)}, field_results
+
+def evaluate_file(json_output_file, txt_file, default_document_type):
+    """
+    Scores one results JSON against its ground truth and stores the scores in the JSON.
+
+    Runs in a worker process, so it returns a plain report instead of printing counters.
+    The report carries the state and hash of both files as they are after scoring,
+    so the next run can tell whether they changed.
+
+    Returns:
+        dict: "accuracy" and per-field "fields" counts on success, "error" otherwise.
+    """
+    with open(json_output_file, "r", encoding="utf-8") as f:
+        json_data = json.load(f)
+
+    report, field_results = score_result(json_data, txt_file, default_document_type)
+    if field_results is not None:
+        json_data["overall_accuracy"] = report["accuracy"]
+        json_data["field_results"] = field_results
+        write_atomic(json_output_file, json.dumps(json_data, ensure_ascii=False, indent=4))
+
+    report.update(
+        results_state=file_state(json_output_file), results_hash=file_hash(json_output_file),
+        gt_state=file_state(txt_file), gt_hash=file_hash(txt_file),
+    )
+    return report
+
+# Scores saved in the result store per transaction
+SCORES_GROUP_SIZE = 256
+
+# Result store opened once per worker process
+_worker_stores = {}
+
+def evaluate_stored(store_path, name, txt_file, default_document_type):
+    """
+    Scores one result of the result store. The parent process saves the scores in the
+    store (ResultStore.save_scores), so workers never write to it.
+
+    The worker reads the result itself, so the parent process only passes names
+    around and results are never all held in memory at once.
+
+    Returns:
+        dict: Same report as evaluate_file, with the hash of the result as it was read,
+        plus the "field_results" to save on success.
+    """
+    store = _worker_stores.get(store_path)
+    if store is None:
+        store = _worker_stores[store_path] = ResultStore(store_path)
+    entry = store.get_entry(name)
+    if entry is None:
+        return {"error": "Result removed from the store"}
+    result_hash, result = entry
+
+    report, field_results = score_result(result, txt_file, default_document_type)
+    if field_results is not None:
+        report["field_results"] = field_results
+    report.update(
+        results_state=None, results_hash=result_hash,
+        gt_state=file_state(txt_file), gt_hash=file_hash(txt_file),
+    )
+    return report
+
+def scorer_version():
+    """
+    Fingerprints the scoring code: this module and the schemas (which decide how fields are scored).
+
+    Returns:
+        str: SHA-256 of their sources, so editing either one re-scores every document.
+    """
+    digest = hashlib.sha256()
+    for path in (os.path.abspath(__file__), inspect.getsourcefile(get_schema)):
+        digest.update(file_hash(path).encode("ascii"))
+    return digest.hexdigest()
+
+def is_unchanged(entry, json_output_file, txt_file, results_hash=None, version=None):
+    """
+    Checks a manifest entry against the files on disk.
+
+    Files with the recorded modification time and size are trusted without being read;
+    otherwise their hash decides, and the entry's state is refreshed when only the state changed.
+    A result from the store is given by its `results_hash` instead of a file. Entries scored
+    by another `version` of the scoring code (see scorer_version) are never reused.
+    """
+    if entry is None or entry.get("scorer_version") != version:
+        return False
+    checked = [("gt", txt_file)]
+    if results_hash is None:
+        checked.insert(0, ("results", json_output_file))
+    elif results_hash != entry["results_hash"]:
+        return False
+    for kind, path in checked:
+        state = file_state(path)
+        if state == entry[f"{kind}_state"]:
+            continue
+        if file_hash(path) != entry[f"{kind}_hash"]:
+            return False
+        entry[f"{kind}_state"] = state
+    return True
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def build_report(manifest, failed_files):
+    """
+    Aggregates the manifest into per-directory and per-field accuracy.
+
+    Returns:
+        dict: Directory -> documents, mean document accuracy and field accuracies, plus the failed files.
+    """
+    directories = {}
+    for key, entry in sorted(manifest.items()):
+        sub_dir, _ = key.split("/", 1)
+        stats = directories.setdefault(sub_dir, {"documents": 0, "accuracy_sum": 0.0, "fields": {}})
+        if "error" in entry:
+            continue
+        stats["documents"] += 1
+        stats["accuracy_sum"] += entry["accuracy"]
+        for field, (matched, total) in entry["fields"].items():
+            counts = stats["fields"].setdefault(field, [0, 0])
+            counts[0] += matched
+            counts[1] += total
+
+    report = {}
+    for sub_dir, stats in directories.items():
+        report[sub_dir] = {
+            "documents": stats["documents"],
+            "accuracy": stats["accuracy_sum"] / stats["documents"] if stats["documents"] else 0,
+            "fields": {
+                field: {"matched": matched, "total": total, "accuracy": matched / total if total else 0}
+                for field, (matched, total) in sorted(stats["fields"].items())
+            },
+        }
+    return {"directories": report, "failed_files": failed_files}
+
+def report_csv(report):
+    """Renders the report as CSV rows: directory, field, matched, total, accuracy."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["directory", "field", "matched", "total", "accuracy"])
+    for sub_dir, stats in report["directories"].items():
+        writer.writerow([sub_dir, "(documents)", "", stats["documents"], f"{stats['accuracy']:.4f}"])
+        for field, counts in stats["fields"].items():
+            writer.writerow([sub_dir, field, counts["matched"], counts["total"], f"{counts['accuracy']:.4f}"])
+    return buffer.getvalue()
+
 if __name__ == "__main__":
     # Define directories
     data_dirs = {
@@ -99,15 +374,44 @@ if __name__ == "__main__":
         "RG_Aberto": "data/RG_Aberto"
     }
     results_dir = "results"
-    summary = {key: [] for key in data_dirs.keys()}
+    manifest_path = os.path.join(results_dir, "evaluation_manifest.json")
 
-    total_files = 0
-    processed_files = 0
+    # Scores of unchanged result/ground-truth pairs are reused from the previous run
+    previous = load_manifest(manifest_path)
+    version = scorer_version()
+    manifest = {}
     failed_files = []
-    accuracy_sums = {key: 0 for key in data_dirs.keys()}
-    document_stats = {key: {"total": 0, "processed": 0} for key in data_dirs.keys()}
+    jobs = []
+    # Results saved in the result store are streamed from it instead of one JSON file per document
+    store_path = os.path.join(results_dir, "results.sqlite3")
+    store = ResultStore(store_path) if os.path.exists(store_path) else None
+
+    def ground_truth_for(sub_dir, data_path, file_name):
+        txt_file = os.path.join(data_path, f"{file_name.replace('.json', '')}_gt_ocr.txt")
+        if not os.path.exists(txt_file):
+            print(f"⚠️ Missing ground truth for {file_name}. Logging as error.")
+            failed_files.append({"file_name": file_name, "error": "Ground truth missing"})
+            return None
+        return txt_file
 
     for sub_dir, data_path in data_dirs.items():
+        default_document_type = detect_document_type(sub_dir)
+
+        if store is not None:
+            print(f"🔍 Processing {sub_dir} from {store_path}")
+            for name, result_hash in store.iter_hashes(prefix=f"{sub_dir}/"):
+                file_name = f"{name.split('/', 1)[1]}.json"
+                txt_file = ground_truth_for(sub_dir, data_path, file_name)
+                if txt_file is None:
+                    continue
+                key = f"{sub_dir}/{file_name}"
+                entry = previous.get(key)
+                if is_unchanged(entry, None, txt_file, result_hash, version):
+                    manifest[key] = entry
+                else:
+                    jobs.append((key, file_name, evaluate_stored, (store_path, name, txt_file, default_document_type)))
+            continue
+
         results_path = os.path.join(results_dir, sub_dir)
         
         if not os.path.exists(results_path):
@@ -120,42 +424,64 @@ if __name__ == "__main__":
             if not file_name.endswith(".json"):
                 continue  
 
-            total_files += 1
-            document_stats[sub_dir]["total"] += 1
             json_output_file = os.path.join(results_path, file_name)
-            base_name = file_name.replace(".json", "")
-            txt_file = os.path.join(data_path, f"{base_name}_gt_ocr.txt")
-
-            if not os.path.exists(txt_file):
-                print(f"⚠️ Missing ground truth for {file_name}. Logging as error.")
-                failed_files.append({"file_name": file_name, "error": "Ground truth missing"})
+            txt_file = ground_truth_for(sub_dir, data_path, file_name)
+            if txt_file is None:
                 continue
 
-            try:
-                with open(json_output_file, "r", encoding="utf-8") as f:
-                    json_data = json.load(f)
-                    extracted_info = json_data.get("Informações Organizadas", {})
+            key = f"{sub_dir}/{file_name}"
+            entry = previous.get(key)
+            if is_unchanged(entry, json_output_file, txt_file, version=version):
+                manifest[key] = entry
+            else:
+                jobs.append((key, file_name, evaluate_file, (json_output_file, txt_file, default_document_type)))
 
-                if not extracted_info:
-                    print(f"⚠️ JSON {file_name} is empty or lacks expected fields. Logging as error.")
-                    failed_files.append({"file_name": file_name, "error": "JSON missing organized information"})
+    print(f"♻️ {len(manifest)} unchanged documents reused, {len(jobs)} to evaluate.")
+
+    # Documents are scored in parallel, one process per core
+    if jobs:
+        with ProcessPoolExecutor() as executor:
+            futures = [executor.submit(func, *func_args) for _, _, func, func_args in jobs]
+            # Per-field results of stored documents are saved in the store, a group at a time
+            scores = []
+            for (key, file_name, func, func_args), future in zip(jobs, futures):
+                try:
+                    report = future.result()
+                except Exception as e:
+                    print(f"❌ Error processing {file_name}: {e}")
+                    failed_files.append({"file_name": file_name, "error": str(e)})
                     continue
 
-                ground_truth_text = extract_ground_truth_text(txt_file)
-                field_results, overall_accuracy = check_field_accuracy(extracted_info, ground_truth_text)
+                field_results = report.pop("field_results", None)
+                manifest[key] = dict(report, scorer_version=version)
+                if "error" in report:
+                    print(f"⚠️ JSON {file_name} is empty or lacks expected fields. Logging as error.")
+                elif func is evaluate_stored:
+                    scores.append((func_args[1], report["results_hash"], report["accuracy"], field_results))
+                    if len(scores) >= SCORES_GROUP_SIZE:
+                        store.save_scores(scores)
+                        scores = []
+                    print(f"✅ {file_name} scored with accuracy {report['accuracy']:.2%}, saved in {store_path}")
+                else:
+                    print(f"✅ {file_name} updated with accuracy: {report['accuracy']:.2%}")
+            if scores:
+                store.save_scores(scores)
+
+    if store is not None:
+        store.close()
+
+    failed_files += [
+        {"file_name": key.split("/", 1)[1], "error": entry["error"]}
+        for key, entry in sorted(manifest.items()) if "error" in entry
+    ]
 
-                json_data["overall_accuracy"] = overall_accuracy
-                json_data["field_results"] = field_results
+    write_atomic(manifest_path, json.dumps(manifest, ensure_ascii=False))
 
-                with open(json_output_file, "w", encoding="utf-8") as f:
-                    json.dump(json_data, f, ensure_ascii=False, indent=4)
+    summary = build_report(manifest, failed_files)
+    write_atomic(os.path.join(results_dir, "summary.json"), json.dumps(summary, ensure_ascii=False, indent=4))
+    write_atomic(os.path.join(results_dir, "summary.csv"), report_csv(summary))
 
-                print(f"✅ {file_name} updated with accuracy: {overall_accuracy:.2%}")
-                summary[sub_dir].append({"file_name": file_name, "accuracy": overall_accuracy})
-                accuracy_sums[sub_dir] += overall_accuracy
-                processed_files += 1
-                document_stats[sub_dir]["processed"] += 1
-            
-            except Exception as e:
-                print(f"❌ Error processing {file_name}: {e}")
-                failed_files.append({"file_name": file_name, "error": str(e)})
\ No newline at end of file
+    for sub_dir, stats in summary["directories"].items():
+        print(f"📊 {sub_dir}: {stats['documents']} documents, accuracy {stats['accuracy']:.2%}")
+    if failed_files:
+        print(f"⚠️ {len(failed_files)} files failed. See results/summary.json.")
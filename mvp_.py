@@ -1,10 +1,8 @@
 import json
 import abstra.forms as af
 from doc_vision.process_document import process_document
-import pdf2image
-from io import BytesIO
-from PIL import Image
-import tempfile
+from doc_vision.pdf import process_pdf
+from doc_vision.images import to_image_bytes
 
 # Select document type
 document_type = af.read_dropdown(
@@ -26,31 +24,18 @@ if uploaded_file:
         
         # Check if it is a PDF
         if uploaded_file.name.endswith(".pdf"):
-            print("📄 Documento PDF detectado. Convertendo para imagem...")
+            print("📄 Documento PDF detectado. Processando páginas...")
 
-            # Convert the first page of the PDF to an image (JPG)
-            images = pdf2image.convert_from_bytes(file_bytes, dpi=300)
-
-            # Save the first page as a temporary image
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_img:
-                images[0].save(temp_img.name, format="JPEG")
-                temp_img_path = temp_img.name 
-
-            print(f"✅ PDF convertido para imagem: {temp_img_path}")
-
-            # Process the extracted image
-            final_result = process_document(temp_img_path, document_type)
+            # Renders only the pages this document type needs, OCR starts on page 1 while the rest render
+            final_result = process_pdf(file_bytes, document_type)
 
         else:
-            # If it is an image, save it as a temporary file and process it directly
-            img = Image.open(BytesIO(file_bytes))
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_img:
-                img.save(temp_img.name, format="JPEG")
-                temp_img_path = temp_img.name
+            # JPEG/PNG bytes go to OCR as they are; other formats are converted in memory
+            image_bytes = to_image_bytes(file_bytes)
 
-            print(f"✅ Imagem carregada: {temp_img_path}")
+            print(f"✅ Imagem carregada: {len(image_bytes)} bytes")
 
-            final_result = process_document(temp_img_path, document_type)
+            final_result = process_document(image_bytes, document_type)
 
         # Debug logs
         print(f"""✅ DEBUG: Resultado final:
@@ -1,11 +1,9 @@
 import json
 from doc_vision.process_document import process_document
-import pdf2image
-from io import BytesIO
-from PIL import Image
-import tempfile
+from doc_vision.pdf import process_pdf
+from doc_vision.images import to_image_bytes
+from doc_vision.download import download_document
 from abstra.tasks import get_trigger_task, send_task
-import requests
 
 task = get_trigger_task()
 
@@ -19,49 +17,39 @@ document_extension = task['document_extension']
 document_url = task['document_url']
 
 def get_document_content(url):
-    response = requests.get(url)
-    if response.status_code == 200:
-        document_content = response.content
-        return document_content
-    else:
-        print("Falha ao baixar o documento")
+    """Streams the document with the shared HTTP session, with timeouts and a size limit."""
+    try:
+        return download_document(url)
+    except Exception as e:
+        print(f"Falha ao baixar o documento: {e}")
         return None
 
 uploaded_file = get_document_content(document_url)
 
 if uploaded_file:
-    print("Documento obtido com sucesso")
+    print(f"Documento obtido com sucesso ({uploaded_file.kind or 'formato desconhecido'})")
 
 if uploaded_file:
     try:
         # Read file bytes
-        file_bytes = uploaded_file
-
-        # Check if is pdf
-        if document_extension.endswith('pdf'):
-            print("📄 Documento PDF detectado. Convertendo para imagem...")
-
-            images = pdf2image.convert_from_bytes(file_bytes, dpi=300)
-
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_img:
-                images[0].save(temp_img.name, format="JPEG")
-                temp_img_path = temp_img.name 
+        file_bytes = uploaded_file.content
 
-            print(f"✅ PDF convertido para imagem: {temp_img_path}")
+        # The format sniffed from the bytes wins; the declared extension only covers unknown formats
+        if uploaded_file.is_pdf or (uploaded_file.kind is None and document_extension.endswith('pdf')):
+            print("📄 Documento PDF detectado. Processando páginas...")
 
-            # Process the extracted image
-            final_result = process_document(temp_img_path, document_type)
+            # Renders only the pages this document type needs, OCR starts on page 1 while the rest render
+            final_result = process_pdf(file_bytes, document_type)
 
         else:
-            # If it is an image, save it as a temporary file and process it directly
-            img = Image.open(BytesIO(file_bytes))
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_img:
-                img.save(temp_img.name, format="JPEG")
-                temp_img_path = temp_img.name
+            # JPEG/PNG bytes go to OCR as they are; other formats are converted in memory
+            image_bytes = to_image_bytes(file_bytes)
 
-            print(f"✅ Imagem carregada: {temp_img_path}")
+            print(f"✅ Imagem carregada: {len(image_bytes)} bytes")
 
-            final_result = process_document(temp_img_path, document_type)
+            # Untouched bytes keep the hash computed while downloading
+            content_hash = uploaded_file.sha256 if image_bytes is file_bytes else None
+            final_result = process_document(image_bytes, document_type, content_hash=content_hash)
 
         # Debug logs
         print(f"""✅ DEBUG: Resultado final:
@@ -0,0 +1,75 @@
+import pytest
+from doc_vision import ratelimit
+from doc_vision.ratelimit import RateLimiter, is_retryable
+
+
+def _openai_connection_error():
+    openai = pytest.importorskip("openai")
+    httpx = pytest.importorskip("httpx")
+    return openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+
+
+def _openai_timeout_error():
+    openai = pytest.importorskip("openai")
+    httpx = pytest.importorskip("httpx")
+    return openai.APITimeoutError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+
+
+def _google_deadline_exceeded():
+    exceptions = pytest.importorskip("google.api_core.exceptions")
+    return exceptions.DeadlineExceeded("Deadline exceeded")
+
+
+def _google_service_unavailable():
+    exceptions = pytest.importorskip("google.api_core.exceptions")
+    return exceptions.ServiceUnavailable("Service unavailable")
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(ratelimit.time, "sleep", lambda seconds: None)
+
+
+@pytest.mark.parametrize("make_error", [
+    lambda: ConnectionError("reset"),
+    lambda: TimeoutError("timed out"),
+    lambda: _StatusError(429),
+    lambda: _StatusError(503),
+    _openai_connection_error,
+    _openai_timeout_error,
+    _google_deadline_exceeded,
+    _google_service_unavailable,
+])
+def test_retryable_errors_are_retried(make_error):
+    error = make_error()
+    assert is_retryable(error)
+
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise error
+        return "ok"
+
+    assert RateLimiter("test", rpm=None, concurrency=1).call(flaky) == "ok"
+    assert len(attempts) == 2
+
+
+@pytest.mark.parametrize("error", [ValueError("bad"), _StatusError(400), _StatusError(401)])
+def test_other_errors_are_raised_at_once(error):
+    attempts = []
+
+    def failing():
+        attempts.append(1)
+        raise error
+
+    with pytest.raises(type(error)):
+        RateLimiter("test", rpm=None, concurrency=1).call(failing)
+    assert len(attempts) == 1